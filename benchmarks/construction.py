@@ -0,0 +1,72 @@
+"""
+Build time of flat circuits of growing size, up to 10^5 components, to check that construction
+stays linear (time per component roughly constant):
+
+    python benchmarks/construction.py [--max 100000]
+
+'chain' connects N inverters in series (connect() per component), 'bank' feeds N And gates
+from an N-bit bus and a shared enable and collects their outputs, wired with the bulk
+set_as_inputs()/set_as_outputs(). Build covers add_components() and the wiring; schedule is the
+first set_components_in_order_to_run(); first use is the first run() (clock_next() for a part
+with a clock), which builds the flyweight copies the part is made of. RAMs built as in the
+README are listed for reference; their N counts the components added while building, 10 per
+level (8 cells, a DMux8way and a Mux8way16), each smaller RAM being built once and then copied,
+so their build time only covers the handles to those copies: the rest of the hierarchy (every
+register of every cell) is built on first use.
+"""
+import argparse
+import time
+
+import parts
+from ecs_simulator import *
+
+
+def chain(p, n):
+    C = Circuit(f'Chain{n}', ['in'], ['out'])
+    C.add_components((p['Not'], n))
+    C.set_as_input(0, 'in', 'in')
+    for i in range(1, n):
+        C.connect(i - 1, 'out', i, 'in')
+    C.set_as_output(n - 1, 'out', 'out')
+    return C
+
+
+def bank(p, n):
+    C = Circuit(f'Bank{n}', lbs('in', n) + ['en'], lbs('out', n))
+    C.add_components((p['And'], n))
+    C.set_as_inputs(reversed(range(n)), 'a', 'in')
+    C.set_as_inputs(range(n), 'b', 'en')
+    C.set_as_outputs(reversed(range(n)), 'out', 'out')
+    return C
+
+
+def bench(label, n, fn):
+    t = time.perf_counter()
+    part = fn()
+    built = time.perf_counter() - t
+    t = time.perf_counter()
+    part.set_components_in_order_to_run()
+    scheduled = time.perf_counter() - t
+    t = time.perf_counter()
+    if part.has_clock():
+        part.clock_next()
+    else:
+        part.run()
+    used = time.perf_counter() - t
+    print(f'{label:<8} {n:>8} {built:10.3f} {scheduled:10.3f} {1e6 * (built + scheduled) / n:12.1f} {used:14.3f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max', type=int, default=100000)
+    args = parser.parse_args()
+    p = parts.reference()
+    print(f'{"part":<8} {"N":>8} {"build (s)":>10} {"sched (s)":>10} {"us per comp":>12} {"first use (s)":>14}')
+    n = 100
+    while n <= args.max:
+        bench('chain', n, lambda: chain(p, n))
+        bench('bank', n, lambda: bank(p, n))
+        n *= 10
+    for levels in range(1, 5):
+        words = 8**levels
+        bench(f'Ram{words}', 10*levels, lambda: parts.ram(p, words))
@@ -0,0 +1,65 @@
+"""
+Builds and runs a wide ripple-carry adder and a large RAM with the default recursion limit,
+timing construction, one object-graph evaluation and the compiled netlist.
+
+    python benchmarks/deep_hierarchies.py [--bits 256] [--words 4096]
+"""
+import argparse
+import random
+import sys
+import time
+
+import parts
+from ecs_simulator import *
+
+
+def timed(label, fn):
+    t = time.time()
+    result = fn()
+    print(f'  {label:<28} {time.time() - t:10.3f} s')
+    return result
+
+
+def bench_adder(p, nrbits):
+    print(f'Add{nrbits} (ripple carry)')
+    Add = timed('build', lambda: parts.adder(p, nrbits))
+    a, b = random.getrandbits(nrbits), random.getrandbits(nrbits)
+    Add.inputs.set_as((a << nrbits) | b)
+    timed('run (object graph)', Add.run)
+    assert Add.outputs.value() == (a + b) % 2**nrbits
+    net = timed('compile', Add.compile)
+    bits = list(int(c) for c in format((a << nrbits) | b, f'0{2*nrbits}b'))
+    out = timed('run (netlist)', lambda: net.run(bits))
+    assert int(''.join(map(str, out)), 2) == (a + b) % 2**nrbits
+    print(f'  {net.header()}')
+
+
+def bench_ram(p, words):
+    print(f'Ram{words}')
+    Ram = timed('build', lambda: parts.ram(p, words))
+    nraddr = Ram.inputs.nrbits - 17
+    address = random.randrange(words)
+    data = list(random.randint(0, 1) for _ in range(16))
+    addr = list(int(c) for c in format(address, f'0{nraddr}b'))
+    Ram.set_input_values(data + addr + [1])
+    timed('clock_next (object graph)', Ram.clock_next)
+    Ram.set_input_values([0]*16 + addr + [0])
+    timed('clock_next (object graph)', Ram.clock_next)
+    assert Ram.outputs.str() == ''.join(map(str, data))
+    net = timed('compile', Ram.compile)
+    out = timed('clock_next (netlist)', lambda: net.clock_next([0]*16 + addr + [0]))
+    assert out == data
+    print(f'  {net.header()}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bits', type=int, default=256)
+    parser.add_argument('--words', type=int, default=4096)
+    args = parser.parse_args()
+    limit = sys.getrecursionlimit()
+    p = parts.reference()
+    bench_adder(p, args.bits)
+    bench_ram(p, args.words)
+    assert sys.getrecursionlimit() == limit
+    print(f'Done with the default recursion limit ({limit}).')
@@ -0,0 +1,84 @@
+"""
+Build time, copy() time (before and after the part is first used) and memory held by a
+Register and by RAMs of growing size, as assembled in the README (every part is added to its
+parent with add_components).
+
+    python benchmarks/instancing.py [--words 512] [--no-memory] [--baseline REV]
+
+Memory is the size traced by tracemalloc after building, which slows the build down,
+so it is measured on a separate build. --baseline REV runs the same table first with the
+ecs_simulator.py of git revision REV (ex. the first commit, where copies clone every
+component), for a before/after comparison.
+"""
+import argparse
+import gc
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import parts
+from ecs_simulator import *
+
+
+def build(p, name):
+    if name == 'Register':
+        return parts.sequential(p)['Register']
+    return parts.ram(p, int(name[3:]))
+
+
+def bench(p, name, memory):
+    t = time.time()
+    part = build(p, name)
+    built = time.time() - t
+    t = time.time()
+    part.copy()
+    copied = time.time() - t
+    t = time.time()
+    part.clock_next()
+    clocked = time.time() - t
+    t = time.time()
+    part.copy()
+    used = time.time() - t
+    line = f'{name:<10} {built:10.3f} {copied:10.3f} {clocked:12.3f} {used:12.3f}'
+    if memory:
+        del part
+        gc.collect()
+        tracemalloc.start()
+        part = build(p, name)
+        line += f' {tracemalloc.get_traced_memory()[0] / 2**20:12.1f}'
+        tracemalloc.stop()
+    print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--words', type=int, default=512)
+    parser.add_argument('--no-memory', dest='memory', action='store_false')
+    parser.add_argument('--baseline', metavar='REV', default=None)
+    args = parser.parse_args()
+    if not args.baseline is None:
+        here = os.path.dirname(os.path.abspath(__file__))
+        source = subprocess.run(['git', 'show', f'{args.baseline}:ecs_simulator.py'], cwd=here,
+            capture_output=True, text=True, check=True).stdout
+        with tempfile.TemporaryDirectory(prefix='ecs_baseline_') as dirpath:
+            with open(os.path.join(dirpath, 'ecs_simulator.py'), 'w') as f:
+                f.write(source)
+            argv = [a for a in sys.argv if a != '--baseline' and a != args.baseline]
+            # ecs_simulator is imported from dirpath before parts.py puts this tree first on the path
+            bootstrap = f'import sys, runpy; sys.path.insert(0, {dirpath!r}); import ecs_simulator; ' \
+                f'sys.path.insert(0, {here!r}); sys.argv = {argv!r}; runpy.run_path({argv[0]!r}, run_name="__main__")'
+            print(f'{args.baseline}:')
+            subprocess.run([sys.executable, '-c', bootstrap], cwd=dirpath, check=True)
+        print('this tree:')
+    p = parts.reference()
+    names = ['Register']
+    words = 8
+    while words <= args.words:
+        names.append(f'Ram{words}')
+        words *= 8
+    print(f'{"part":<10} {"build (s)":>10} {"copy (s)":>10} {"clock (s)":>12} {"copy used (s)":>12}' + (f' {"memory (MB)":>12}' if args.memory else ''))
+    for name in names:
+        bench(p, name, args.memory)
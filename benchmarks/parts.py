@@ -0,0 +1,297 @@
+"""
+Reference parts used by the benchmarks, built in memory exactly as in cap1.py, cap2.py,
+cap3.py and the README (nothing is saved to the library), plus scaled-up variants.
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ecs_simulator import *
+
+
+def gates():
+    Not = Gate('Not', 1, ['in'], ['out'])
+    Not.set_as_vcc(0, 'C')
+    Not.set_as_gnd(0, 'E')
+    Not.set_as_input(0, 'B', 'in')
+    Not.set_as_output(0, 'C', 'out')
+
+    And = Gate('And', 2, ['a', 'b'], ['out'])
+    And.set_as_vcc(0, 'C')
+    And.set_as_gnd(1, 'E')
+    And.connect(0, 'E', 1, 'C')
+    And.set_as_input(0, 'B', 'a')
+    And.set_as_input(1, 'B', 'b')
+    And.set_as_output(1, 'E', 'out')
+
+    Or = Gate('Or', 2, ['a', 'b'], ['out'])
+    Or.set_as_vcc(0, 'C')
+    Or.set_as_gnd(1, 'E')
+    Or.connect(0, 'C', 1, 'C')
+    Or.connect(0, 'E', 1, 'E')
+    Or.set_as_input(0, 'B', 'a')
+    Or.set_as_input(1, 'B', 'b')
+    Or.set_as_output(1, 'E', 'out')
+
+    Nor = Gate('Nor', 2, ['a', 'b'], ['out'])
+    Nor.set_as_vcc(0, 'C')
+    Nor.set_as_gnd(1, 'E')
+    Nor.connect(0, 'C', 1, 'C')
+    Nor.connect(0, 'E', 1, 'E')
+    Nor.set_as_input(0, 'B', 'a')
+    Nor.set_as_input(1, 'B', 'b')
+    Nor.set_as_output(1, 'C', 'out')
+
+    Nand = Gate('Nand', 2, ['a', 'b'], 'out')
+    Nand.set_as_vcc(0, 'C')
+    Nand.set_as_gnd(1, 'E')
+    Nand.set_as_input(0, 'B', 'a')
+    Nand.set_as_input(1, 'B', 'b')
+    Nand.set_as_output(1, 'C', 'out')
+    Nand.connect(0, 'E', 1, 'C')
+
+    Or8way = Gate('Or8way', 8, lbs('in', 8), 'out')
+    Or8way.set_as_vcc(0, 'C')
+    Or8way.set_as_gnd(0, 'E')
+    for i in range(1, 8):
+        Or8way.connect(0, 'C', i, 'C')
+        Or8way.connect(0, 'E', i, 'E')
+    for i in range(8):
+        Or8way.set_as_input(i, 'B', f'in{i}')
+    Or8way.set_as_output(0, 'E', 'out')
+
+    return dict(Not=Not, And=And, Or=Or, Nor=Nor, Nand=Nand, Or8way=Or8way)
+
+
+def combinational(p):
+    Xor = Circuit('Xor', ['a', 'b'], ['out'])
+    Xor.add_components(p['Nand'], p['Or'], p['And'])
+    Xor.set_as_input(0, 'a', 'a')
+    Xor.set_as_input(0, 'b', 'b')
+    Xor.set_as_output(2, 'out', 'out')
+    Xor.connect(0, 'a', 1, 'a')
+    Xor.connect(0, 'b', 1, 'b')
+    Xor.connect(0, 'out', 2, 'a')
+    Xor.connect(1, 'out', 2, 'b')
+
+    Mux = Circuit('Mux', ['a', 'b', 'sel'], 'out')
+    Mux.add_components(p['Not'], (p['And'], 2), p['Or'])
+    Mux.set_as_input(1, 'b', 'a')
+    Mux.set_as_input(2, 'b', 'b')
+    Mux.set_as_output(3, 'out', 'out')
+    Mux.connect(1, 'out', 3, 'a')
+    Mux.connect(2, 'out', 3, 'b')
+    Mux.set_as_input(0, 'in', 'sel')
+    Mux.set_as_input(2, 'a', 'sel')
+    Mux.connect(0, 'out', 1, 'a')
+
+    Mux16 = Circuit('Mux16', lbs('a', 16)+lbs('b', 16)+['sel'], lbs('out', 16))
+    Mux16.add_components((Mux, 16))
+    for i in range(16):
+        Mux16.set_as_input(i, 'a', f'a{i}')
+        Mux16.set_as_input(i, 'b', f'b{i}')
+        Mux16.set_as_input(i, 'sel', 'sel')
+        Mux16.set_as_output(i, 'out', f'out{i}')
+
+    Mux4way = Circuit('Mux4way', lbs('@', 4)+['sel1', 'sel0'], 'out')
+    Mux4way.add_components((Mux, 3))
+    Mux4way.set_as_input(2, 'sel', 'sel1')
+    Mux4way.set_as_input(0, 'sel', 'sel0')
+    Mux4way.set_as_input(1, 'sel', 'sel0')
+    Mux4way.set_as_input(0, 'a', 'a')
+    Mux4way.set_as_input(0, 'b', 'b')
+    Mux4way.set_as_input(1, 'a', 'c')
+    Mux4way.set_as_input(1, 'b', 'd')
+    Mux4way.set_as_output(2, 'out', 'out')
+    Mux4way.connect(0, 'out', 2, 'a')
+    Mux4way.connect(1, 'out', 2, 'b')
+
+    Mux8way = Circuit('Mux8way', lbs('@', 8)+lbs('sel', 3), 'out')
+    Mux8way.add_components((Mux4way, 2), Mux)
+    for k, x in enumerate(lbs('@', 8)):
+        Mux8way.set_as_input(k // 4, 'abcd'[k % 4], x)
+    for i in range(2):
+        Mux8way.set_as_input(i, 'sel1', 'sel1')
+        Mux8way.set_as_input(i, 'sel0', 'sel0')
+    Mux8way.set_as_input(2, 'sel', 'sel2')
+    Mux8way.connect(0, 'out', 2, 'a')
+    Mux8way.connect(1, 'out', 2, 'b')
+    Mux8way.set_as_output(2, 'out', 'out')
+
+    Mux8way16 = Circuit('Mux8way16', sum((lbs(x, 16) for x in lbs('@', 8)), []) + lbs('sel', 3), lbs('out', 16))
+    Mux8way16.add_components((Mux8way, 16))
+    for i in range(16):
+        for x in lbs('@', 8):
+            Mux8way16.set_as_input(i, x, f'{x}{i}')
+        for j in range(3):
+            Mux8way16.set_as_input(i, f'sel{j}', f'sel{j}')
+        Mux8way16.set_as_output(i, 'out', f'out{i}')
+
+    DMux = Circuit('DMux', ['in', 'sel'], ['a', 'b'])
+    DMux.add_components(p['Not'], (p['And'], 2))
+    DMux.set_as_input(0, 'in', 'sel')
+    DMux.set_as_input(1, 'a', 'in')
+    DMux.set_as_input(2, 'a', 'in')
+    DMux.set_as_input(2, 'b', 'sel')
+    DMux.connect(0, 'out', 1, 'b')
+    DMux.set_as_output(1, 'out', 'a')
+    DMux.set_as_output(2, 'out', 'b')
+
+    DMux4way = Circuit('DMux4way', ['in', 'sel1', 'sel0'], lbs('@', 4))
+    DMux4way.add_components((DMux, 3))
+    DMux4way.set_as_input(0, 'in', 'in')
+    DMux4way.set_as_input(0, 'sel', 'sel1')
+    DMux4way.set_as_input(1, 'sel', 'sel0')
+    DMux4way.set_as_input(2, 'sel', 'sel0')
+    DMux4way.connect(0, 'a', 1, 'in')
+    DMux4way.connect(0, 'b', 2, 'in')
+    for k, x in enumerate(lbs('@', 4)):
+        DMux4way.set_as_output(1 + k // 2, 'ab'[k % 2], x)
+
+    DMux8way = Circuit('DMux8way', ['in'] + lbs('sel', 3), lbs('@', 8))
+    DMux8way.add_components(DMux, (DMux4way, 2))
+    DMux8way.set_as_input(0, 'in', 'in')
+    DMux8way.set_as_input(0, 'sel', 'sel2')
+    for i in range(2):
+        DMux8way.set_as_input(1 + i, 'sel1', 'sel1')
+        DMux8way.set_as_input(1 + i, 'sel0', 'sel0')
+    DMux8way.connect(0, 'a', 1, 'in')
+    DMux8way.connect(0, 'b', 2, 'in')
+    for k, x in enumerate(lbs('@', 8)):
+        DMux8way.set_as_output(1 + k // 4, 'abcd'[k % 4], x)
+
+    return dict(Xor=Xor, Mux=Mux, Mux16=Mux16, Mux4way=Mux4way, Mux8way=Mux8way, Mux8way16=Mux8way16,
+        DMux=DMux, DMux4way=DMux4way, DMux8way=DMux8way)
+
+
+def arithmetic(p):
+    HalfAdder = Circuit('HalfAdder', ['a', 'b'], ['sum', 'carry'])
+    HalfAdder.add_components(p['Xor'], p['And'])
+    HalfAdder.set_as_input(0, 'a', 'a')
+    HalfAdder.set_as_input(0, 'b', 'b')
+    HalfAdder.set_as_input(1, 'a', 'a')
+    HalfAdder.set_as_input(1, 'b', 'b')
+    HalfAdder.set_as_output(0, 'out', 'sum')
+    HalfAdder.set_as_output(1, 'out', 'carry')
+
+    FullAdder = Circuit('FullAdder', ['a', 'b', 'c'], ['sum', 'carry'])
+    FullAdder.add_components((HalfAdder, 2), p['Or'])
+    FullAdder.set_as_input(0, 'a', 'a')
+    FullAdder.set_as_input(0, 'b', 'b')
+    FullAdder.set_as_input(1, 'b', 'c')
+    FullAdder.connect(0, 'sum', 1, 'a')
+    FullAdder.set_as_output(1, 'sum', 'sum')
+    FullAdder.connect(0, 'carry', 2, 'a')
+    FullAdder.connect(1, 'carry', 2, 'b')
+    FullAdder.set_as_output(2, 'out', 'carry')
+
+    p = dict(p, HalfAdder=HalfAdder, FullAdder=FullAdder)
+    Add16 = adder(p, 16)
+
+    Inc16 = Circuit('Inc16', lbs('inp', 16), lbs('out', 16))
+    Inc16.add_components(Add16)
+    for i in range(16):
+        Inc16.set_as_input(0, f'a{i}', f'inp{i}')
+        Inc16.set_as_output(0, f'out{i}', f'out{i}')
+    Inc16.set_high_input(0, 'b0')
+    for i in range(1, 16):
+        Inc16.set_low_input(0, f'b{i}')
+
+    return dict(HalfAdder=HalfAdder, FullAdder=FullAdder, Add16=Add16, Inc16=Inc16)
+
+
+def adder(p, nrbits):
+    """
+    Ripple-carry adder of 'nrbits' bits (Add16 when nrbits is 16).
+    """
+    Add = Circuit(f'Add{nrbits}', lbs('a', nrbits) + lbs('b', nrbits), lbs('out', nrbits))
+    Add.add_components(p['HalfAdder'], (p['FullAdder'], nrbits - 1))
+    for i in range(nrbits):
+        Add.set_as_input(i, 'a', f'a{i}')
+        Add.set_as_input(i, 'b', f'b{i}')
+        Add.set_as_output(i, 'sum', f'out{i}')
+    for i in range(1, nrbits):
+        Add.connect(i - 1, 'carry', i, 'c')
+    return Add
+
+
+def sequential(p):
+    Dff = Circuit("Dff", 'in', 'out')
+    Dff.add_components(p['Not'], (p['And'], 2), (p['Nor'], 2))
+    Dff.set_as_input(0, 'in', 'in')
+    Dff.set_as_input(1, 'a', 'in')
+    Dff.connect(0, 'out', 2, 'b')
+    Dff.connect(1, 'out', 3, 'a')
+    Dff.connect(2, 'out', 4, 'b')
+    Dff.connect(3, 'out', 4, 'a')
+    Dff.connect(4, 'out', 3, 'b')
+    Dff.set_as_output(4, 'out', 'out')
+    Dff.set_as_clock(1, 'b')
+    Dff.set_as_clock(2, 'a')
+
+    Bit = Circuit("Bit", ['in', 'load'], 'out')
+    Bit.add_components(p['Not'], (p['And'], 2), (p['Nor'], 2), p['And'])
+    Bit.set_as_input(0, 'in', 'in')
+    Bit.set_as_input(1, 'a', 'in')
+    Bit.connect(0, 'out', 2, 'b')
+    Bit.connect(1, 'out', 3, 'a')
+    Bit.connect(2, 'out', 4, 'b')
+    Bit.connect(3, 'out', 4, 'a')
+    Bit.connect(4, 'out', 3, 'b')
+    Bit.set_as_output(4, 'out', 'out')
+    Bit.set_as_input(5, 'a', 'load')
+    Bit.set_as_clock(5, 'b')
+    Bit.connect(5, 'out', 1, 'b')
+    Bit.connect(5, 'out', 2, 'a')
+
+    Register = Circuit("Register", lbs('in', 16) + ['load'], lbs('out', 16))
+    Register.add_components((Bit, 16))
+    for i in range(16):
+        Register.set_as_input(i, 'in', f'in{i}')
+        Register.set_as_input(i, 'load', 'load')
+        Register.set_as_output(i, 'out', f'out{i}')
+        Register.set_as_clock(i, 'clock')
+
+    return dict(Dff=Dff, Bit=Bit, Register=Register)
+
+
+def ram(p, words):
+    """
+    RAM8, RAM64, RAM512, RAM4K... (words a power of 8), built as in the README: 8 smaller
+    memories (or Registers) selected by a DMux8way on 'load' and a Mux8way16 on 'out'.
+    """
+    nraddr = 0
+    while 8**nraddr < words:
+        nraddr += 1
+    if 8**nraddr != words or nraddr == 0:
+        raise ValueError(f"RAM size must be a power of 8, not {words}.")
+    cell = p['Register'] if nraddr == 1 else ram(p, words // 8)
+    Ram = Circuit(f'Ram{words}', lbs('in', 16) + lbs('addr', 3*nraddr) + ['load'], lbs('out', 16))
+    Ram.add_components((cell, 8), p['DMux8way'], p['Mux8way16'])
+    alpha = lbs('@', 8)
+    for i in range(8):
+        for j in range(16):
+            Ram.set_as_input(i, f'in{j}', f'in{j}')
+            Ram.connect(i, f'out{j}', 9, f'{alpha[i]}{j}')
+        Ram.connect(8, alpha[i], i, 'load')
+        Ram.set_as_clock(i, 'clock')
+        for j in range(3*(nraddr - 1)):
+            Ram.set_as_input(i, f'addr{j}', f'addr{j}')
+    Ram.set_as_input(8, 'in', 'load')
+    for j in range(16):
+        Ram.set_as_output(9, f'out{j}', f'out{j}')
+    for j in range(3):
+        Ram.set_as_input(8, f'sel{j}', f'addr{j + 3*(nraddr - 1)}')
+        Ram.set_as_input(9, f'sel{j}', f'addr{j + 3*(nraddr - 1)}')
+    return Ram
+
+
+def reference():
+    """
+    Every reference part of cap1.py to cap3.py plus the README's multiplexers and demultiplexers.
+    """
+    p = gates()
+    p.update(combinational(p))
+    p.update(arithmetic(p))
+    p.update(sequential(p))
+    return p
@@ -0,0 +1,255 @@
+"""
+Repeatable benchmarks over the reference parts of cap1.py to cap3.py (Not, And, Or, Mux, Mux16,
+Or8way, Mux4way, HalfAdder, FullAdder, Add16, Inc16, Dff, Bit, Register) and scaled-up variants
+(Add64, Ram8, Ram64), written as JSON so that two runs can be compared:
+
+    python benchmarks/suite.py [--parts Add16,Register] [--repeat 20] [--rounds 3] [--output run.json]
+    python benchmarks/suite.py --compare before.json after.json [--threshold 0.10] [--floor 0.005]
+
+Per part: copy, save and load times (.sim, in a temporary library, load and compile without
+the in-memory caches), compile time, latency of one evaluation (run() or clock_next(), object
+graph and netlist), throughput (vectors per second for combinational parts, evaluated
+bitsliced on the netlist; clocked cycles per second for sequential ones) and the peak memory
+traced while a copy is first evaluated. Build times are per group of parts, as parts.py builds
+them, and include the first evaluation of every part built (which builds the flyweight copies
+they are made of). Every time is the best of --repeat calls or more, see best(), in each of
+--rounds runs of the whole suite, and then the best of those rounds: the machine being slowed
+down for a while then only spoils one of them. The spread of every time, written apart under
+'spread', is the largest of its range over the rounds and of its spread in each round (median
+minus best of the calls).
+
+Metrics ending in '_s' or '_bytes' are better when lower, those ending in '_per_s' when higher
+(these are derived from a time: only that time is flagged). --compare lists the metrics worse
+than 'threshold' (relative) and by more than their spread in the 'before' run, and exits with
+status 1 if any; times under --floor seconds in both runs, and runs made with fewer than
+MIN_REPEAT repeats (by an older version of this script), are listed but never flagged.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import parts
+from ecs_simulator import *
+
+REFERENCE = ['Not', 'And', 'Or', 'Mux', 'Mux16', 'Or8way', 'Mux4way', 'HalfAdder', 'FullAdder',
+    'Add16', 'Inc16', 'Dff', 'Bit', 'Register']
+SCALED = ['Add64', 'Ram8', 'Ram64']
+SEQUENTIAL = ['Dff', 'Bit', 'Register', 'Ram8', 'Ram64']
+MIN_REPEAT = 5 # calls timed per metric, whatever the budget
+MIN_TIME = 0.2 # seconds spent timing each metric, at least
+
+
+def timed(fn):
+    t = time.perf_counter()
+    fn()
+    return time.perf_counter() - t
+
+
+def best(fn, repeat, budget=2.0):
+    """
+    Best time of 'fn', the one least disturbed by other processes, over 'repeat' calls (fewer if
+    they take longer than 'budget' seconds, but never fewer than MIN_REPEAT), and more calls while
+    they take less than MIN_TIME seconds in all; returns it with the spread of those calls, their
+    median minus that best time.
+    """
+    times, start = list(), time.perf_counter()
+    while True:
+        elapsed = time.perf_counter() - start
+        if len(times) >= MIN_REPEAT and elapsed >= MIN_TIME and (len(times) >= repeat or elapsed >= budget):
+            return min(times), statistics.median(times) - min(times)
+        times.append(timed(fn))
+
+
+class Timings(dict):
+    """
+    Metrics of one part (or the build times) and, in 'spread', the spread of the times among them.
+    """
+    def __init__(self):
+        super().__init__()
+        self.spread = dict()
+    def best(self, metric, fn, repeat):
+        self[metric], self.spread[metric] = best(fn, repeat)
+        return self[metric]
+    @staticmethod
+    def merge(rounds):
+        """
+        Best value of every metric over 'rounds' (highest for '_per_s', lowest otherwise); the
+        spread of a time is the largest of its range over the rounds and of its spread in each.
+        """
+        merged = Timings()
+        for metric in rounds[0]:
+            values = list(r[metric] for r in rounds)
+            merged[metric] = max(values) if metric.endswith('_per_s') else min(values)
+            if metric in rounds[0].spread:
+                merged.spread[metric] = max(max(values) - min(values), *(r.spread[metric] for r in rounds))
+        return merged
+
+
+def uncached(fn):
+    """
+    'fn' run with empty in-memory caches (and no netlist cache on disk), as in a new process.
+    """
+    def cold():
+        Library._memo.clear()
+        Netlist._compiled.clear()
+        shutil.rmtree(os.path.join(Library.dirpath, 'cache'), ignore_errors=True)
+        fn()
+    return cold
+
+
+def first_use(built):
+    """
+    Evaluates every part of 'built' once (clock_next() if it has a clock, run() otherwise), which
+    builds the flyweight copies it is made of; returns 'built'.
+    """
+    for part in built.values():
+        if part.has_clock():
+            part.clock_next()
+        else:
+            part.run()
+    return built
+
+
+def build(repeat):
+    """
+    Builds every part, returning them and the time of each group, built and evaluated once.
+    """
+    p, times = dict(), Timings()
+    for group, fn in [('gates', parts.gates), ('combinational', lambda: parts.combinational(p)),
+            ('arithmetic', lambda: parts.arithmetic(p)), ('sequential', lambda: parts.sequential(p))]:
+        times.best(group, lambda: p.update(first_use(fn())), repeat)
+    for name in SCALED:
+        size = int(name[3:])
+        fn = (lambda: parts.adder(p, size)) if name.startswith('Add') else (lambda: parts.ram(p, size))
+        times.best(name, lambda: p.update(first_use({name: fn()})), repeat)
+    return p, times
+
+
+def stepper(target, step, vectors):
+    """
+    Function applying the next of 'vectors' to 'target' (a part or its netlist) and calling 'step'.
+    """
+    values = itertools.cycle(vectors)
+    if isinstance(target, Netlist):
+        return lambda: step(next(values))
+    def fn():
+        target.set_input_values(next(values))
+        step()
+    return fn
+
+
+def bench(part, sequential, repeat):
+    result = Timings()
+    name = f'bench_{part.name}'
+    result.best('copy_s', part.copy, repeat)
+    result.best('save_s', lambda: part.save(name + '.sim'), repeat)
+    result.best('load_s', uncached(lambda: Library.load(name)), repeat)
+    tracemalloc.start()
+    instance = part.copy()
+    if sequential:
+        instance.clock_next()
+    else:
+        instance.run()
+    result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result.best('compile_s', uncached(part.compile), repeat)
+    net = part.compile()
+    nrinputs = part.inputs.nrbits
+    vectors = list(list(random.randint(0, 1) for _ in range(nrinputs)) for _ in range(repeat))
+    if sequential:
+        result['cycles_object_per_s'] = 1 / result.best('clock_object_s', stepper(part, part.clock_next, vectors), repeat)
+        result['cycles_netlist_per_s'] = 1 / result.best('clock_netlist_s', stepper(net, net.clock_next, vectors), repeat)
+    else:
+        result.best('run_object_s', stepper(part, part.run, vectors), repeat)
+        result.best('run_netlist_s', stepper(net, net.run, vectors), repeat)
+        lanes = Gate.bitslice_lanes
+        words = list(random.getrandbits(lanes) for _ in range(nrinputs))
+        result['vectors_per_s'] = lanes / result.best('run_words_s', lambda: net.run_words(words, lanes), repeat)
+    return result
+
+
+def run(args):
+    random.seed(args.seed)
+    names = REFERENCE + SCALED if args.parts is None else args.parts.split(',')
+    rounds = list()
+    with tempfile.TemporaryDirectory(prefix='ecs_bench_') as dirpath:
+        Library.change_ospath(dirpath)
+        for i in range(args.rounds):
+            p, build_times = build(args.repeat)
+            results = dict()
+            for name in names:
+                t = time.perf_counter()
+                results[name] = bench(p[name], name in SEQUENTIAL, args.repeat)
+                print(f'{i + 1}/{args.rounds} {name:<10} {time.perf_counter() - t:8.2f} s', file=sys.stderr)
+            rounds.append((build_times, results))
+    build_times = Timings.merge(list(b for b, _ in rounds))
+    results = dict((name, Timings.merge(list(r[name] for _, r in rounds))) for name in names)
+    report = dict(python=platform.python_version(), platform=platform.platform(), time=time.strftime('%Y-%m-%d %H:%M:%S'),
+        repeat=args.repeat, rounds=args.rounds, build_s=build_times, parts=results,
+        spread=dict(build_s=build_times.spread, parts=dict((k, v.spread) for k, v in results.items())))
+    text = json.dumps(report, indent=1)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+
+def compare(before, after, threshold, floor):
+    """
+    Prints every metric present in both runs with its ratio after/before; returns the regressions.
+    """
+    with open(before) as f:
+        old = json.load(f)
+    with open(after) as f:
+        new = json.load(f)
+    reliable = min(old.get('repeat', 0), new.get('repeat', 0)) >= MIN_REPEAT
+    if not reliable:
+        print(f'runs made with --repeat below {MIN_REPEAT}: nothing is flagged.')
+    def spread(run, name, metric): # 0 for files written before spreads were
+        spreads = run.get('spread', dict())
+        spreads = spreads.get('build_s', dict()) if name == 'build' else spreads.get('parts', dict()).get(name, dict())
+        return spreads.get(metric, 0)
+    rows = list((('build', k), old['build_s'][k], new['build_s'][k]) for k in old['build_s'] if k in new['build_s'])
+    rows += list(((name, k), v, new['parts'][name][k]) for name in old['parts'] if name in new['parts']
+        for k, v in old['parts'][name].items() if k in new['parts'][name])
+    regressions = list()
+    for (name, metric), a, b in rows:
+        noise = spread(old, name, metric)
+        metric = metric if name != 'build' else metric + '_s'
+        ratio = b / a if a > 0 else float('inf')
+        flagged = reliable and not metric.endswith('_per_s') and (metric.endswith('_bytes') or max(a, b) >= floor)
+        worse = flagged and ratio > 1 + threshold and b - a > noise
+        if worse:
+            regressions.append((name, metric))
+        print(f'{name:<14} {metric:<22} {a:14.6g} {b:14.6g} {ratio:8.3f}' + ('  REGRESSION' if worse else ''))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--parts', default=None)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'))
+    parser.add_argument('--threshold', type=float, default=0.10)
+    parser.add_argument('--floor', type=float, default=5e-3)
+    args = parser.parse_args()
+    if args.compare is None:
+        args.repeat = max(args.repeat, MIN_REPEAT) # as best() times them anyway
+        run(args)
+    else:
+        regressions = compare(*args.compare, args.threshold, args.floor)
+        print(f'{len(regressions)} regression(s) above {args.threshold:.0%}.')
+        sys.exit(1 if regressions else 0)
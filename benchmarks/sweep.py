@@ -0,0 +1,43 @@
+"""
+Exhaustive sweeps of Add16 over its low input bits, evaluated here and by worker processes,
+checking that every worker count gives the same results (inputs left out of the sweep keep
+the value set before it) and timing each:
+
+    python benchmarks/sweep.py [--bits 20] [--workers 1,2,4]
+"""
+import argparse
+import random
+import tempfile
+import time
+
+import parts
+from ecs_simulator import *
+
+
+def main(args):
+    p = parts.reference()
+    Add = p['Add16'].copy()
+    random.seed(0)
+    Add.set_input_values([random.randint(0, 1) for _ in range(Add.inputs.nrbits)])
+    Add.run()
+    order = Add.inputs.labels[-args.bits:]
+    expected = None
+    print(f'{"workers":>8} {"vectors":>10} {"time (s)":>10}')
+    for workers in (int(w) for w in args.workers.split(',')):
+        t = time.perf_counter()
+        results = list(Add.sweep(workers=workers, order=order))
+        elapsed = time.perf_counter() - t
+        if expected is None:
+            expected = results
+        assert results == expected, f'workers={workers} disagrees with workers={args.workers.split(",")[0]}'
+        print(f'{workers:>8} {2**len(order):>10} {elapsed:10.3f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bits', type=int, default=20)
+    parser.add_argument('--workers', default='1,2,4')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(prefix='ecs_sweep_') as dirpath:
+        Library.change_ospath(dirpath)
+        main(args)
@@ -4,6 +4,20 @@ import uuid
 # from functools import reduce
 from pathlib import Path
 import time
+import heapq
+import hashlib
+import mmap
+import struct
+import itertools
+import sys
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from types import ModuleType
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 def lbs(prefix, length):
     """
@@ -27,21 +41,110 @@ def dec2bin(decimal, nrbits):
         print(f"Beware, {decimal} cannot be written with {nrbits} bits!")
     return [0]*(nrbits-len(aux)) + aux if len(aux) <= nrbits else aux[(len(aux)-nrbits):]
 
+def get_prefix(label):
+    """
+    bus prefix of a label, i.e. everything before its first digit:
+        ex. get_prefix('out15') => 'out'
+    """
+    for i in range(len(label)):
+        if label[i].isnumeric():
+            return label[0:i]
+    return '' if label.isnumeric() else label
+
+def group_by_prefix(labels):
+    """
+    groups labels by bus prefix, keeping their order:
+        ex. group_by_prefix(['a1', 'a0', 'b1', 'b0']) => {'a': ['a1', 'a0'], 'b': ['b1', 'b0']}
+    """
+    groups = dict()
+    for l in labels:
+        groups.setdefault(get_prefix(l), []).append(l)
+    return groups
+
+
+_VECTOR_SEPARATORS = str.maketrans('', '', ' \t,|')
+
+
+def read_vectors(filename, labels=None):
+    """
+    Lazily reads a vector file, one case per line, as tuples of bits: '0'/'1' characters,
+    optionally separated by spaces, commas or '|'; blank lines and lines starting with '#' are
+    skipped. Files written by a VectorSink also hold the outputs: only their input columns are
+    read (a .csv one marks them in its first line of labels, 'inputs|outputs') or, given
+    'labels', the columns with those labels, in that order:
+        ex. test_set(read_vectors('add16.vec'))
+            Add16.test_set(read_vectors('add16.csv'))
+            Add16.test_set(read_vectors('add16.csv', Add16.inputs.labels))
+    """
+    with open(filename, 'rb') as f:
+        binary = f.read(len(VectorSink._magic)) == VectorSink._magic
+    if binary:
+        yield from VectorSink.read(filename, labels)
+        return
+    with open(filename) as f:
+        first, columns = True, None
+        for nr, line in enumerate(f, 1):
+            line = line.strip()
+            if len(line) == 0 or line.startswith('#'):
+                continue
+            bits = line.translate(_VECTOR_SEPARATORS)
+            if bits.strip('01') != '':
+                if first:
+                    first = False
+                    names = line.split('|')
+                    if not labels is None:
+                        columns = VectorSink._columns(filename, ','.join(names).split(','), labels)
+                    elif len(names) == 2: # input|output labels of a VectorSink
+                        columns = range(len(names[0].split(',')) if names[0] else 0)
+                    continue
+                raise Exception(f"{filename}, line {nr}: not a vector of bits.")
+            first = False
+            case = tuple(map(int, bits))
+            yield case if columns is None else tuple(case[i] for i in columns)
+
+
 class Library:
     dirpath = Path('lib')
     cc_by = None
+    memo_size = 64 # definitions kept in memory by each least-recently-used memo
+    counters = dict.fromkeys(['load hits', 'load misses', 'compile hits', 'compile disk hits', 'compile misses',
+        'codegen hits', 'codegen disk hits', 'codegen misses'], 0)
+    _memo = OrderedDict() # content hash of a .sim file -> its unpickled definition
     @classmethod
     def author(cls, identifier):
         cls.cc_by = identifier
     @classmethod
     def change_ospath(cls, identifier):
         cls.dirpath = Path(identifier)
+    @classmethod
+    def cache_info(cls):
+        return dict(Library.counters)
+    @staticmethod
+    def _recall(memo, key):
+        if key in memo:
+            memo.move_to_end(key)
+            return memo[key]
+    @staticmethod
+    def _remember(memo, key, value):
+        memo[key] = value
+        while len(memo) > Library.memo_size:
+            memo.popitem(last=False)
     @staticmethod
     def load(filename):
+        if filename.endswith('.net'):
+            return Netlist.load(filename)
         if not filename.endswith('.sim'):
             filename += '.sim'
         with open(Library.dirpath / filename, 'rb') as f:
-            aux = pickle.load(f)
+            data = f.read()
+        key = hashlib.sha1(data).hexdigest()
+        aux = Library._recall(Library._memo, key)
+        if aux is None:
+            Library.counters['load misses'] += 1
+            aux = pickle.loads(data)
+            Library._remember(Library._memo, key, aux)
+        else:
+            Library.counters['load hits'] += 1
         return aux.copy()
     def __init__(self, name):
         self.name = name
@@ -63,11 +166,79 @@ if not os.path.isdir(Library.dirpath):
     os.mkdir(Library.dirpath)
 
 
-class Wire(Library):
-    def __init__(self, init=0, changeable=True, name='Wire'):
-        super().__init__(name)
-        self.next = False if init == 0 else True
-        self.changeable = changeable
+class WireStore:
+    """
+    Shared storage for wires, one byte each: bits 0-1 hold the tri-state value (0 low, 1 high,
+    2 disconnected) and bit 2 marks a wire that is not changeable; names other than 'Wire' are
+    kept apart in 'names'.
+    """
+    __slots__ = ('values', 'names')
+    def __init__(self):
+        self.values = bytearray()
+        self.names = dict()
+    def alloc(self, nrwires):
+        start = len(self.values)
+        self.values.extend(bytes(nrwires))
+        return start
+    def __len__(self):
+        return len(self.values)
+    def __getstate__(self):
+        return (bytes(self.values), self.names)
+    def __setstate__(self, state):
+        self.values, self.names = bytearray(state[0]), state[1]
+
+
+_TRISTATE = (False, True, None, None)*2
+_PINNED = 4
+
+
+class Wire:
+    """
+    Lightweight handle to one byte of a WireStore ('id' is its index there); every Gate keeps its
+    own store, standalone wires get a private one.
+    """
+    __slots__ = ('store', 'id')
+    def __init__(self, init=0, changeable=True, name='Wire', store=None, index=None):
+        self.store = WireStore() if store is None else store
+        self.id = self.store.alloc(1) if index is None else index
+        self.store.values[self.id] = (0 if changeable else _PINNED) | (0 if init == 0 else 1)
+        if name != 'Wire':
+            self.store.names[self.id] = name
+    @property
+    def next(self):
+        return _TRISTATE[self.store.values[self.id]]
+    @next.setter
+    def next(self, value):
+        values = self.store.values
+        values[self.id] = (values[self.id] & _PINNED) | (2 if value is None else (1 if value else 0))
+    @property
+    def changeable(self):
+        return not self.store.values[self.id] & _PINNED
+    @changeable.setter
+    def changeable(self, value):
+        values = self.store.values
+        values[self.id] = (values[self.id] & ~_PINNED) | (0 if value else _PINNED)
+    @property
+    def name(self):
+        return self.store.names.get(self.id, 'Wire')
+    @staticmethod
+    def at(store, index):
+        """
+        Handle to wire 'index' of 'store', leaving its value and flags as they are.
+        """
+        w = Wire.__new__(Wire)
+        w.store, w.id = store, index
+        return w
+    def __getstate__(self):
+        return { 'store': self.store, 'id': self.id }
+    def __setstate__(self, state):
+        if type(state) == tuple:
+            state = state[1]
+        if 'store' in state:
+            self.store, self.id = state['store'], state['id']
+        else: # wire pickled before WireStore existed
+            self.__init__(changeable=state.get('changeable', True), name=state.get('name', 'Wire'))
+            self.next = state.get('next', False)
     def __lt__(self, other):
         return self.id < other.id
     def set_high(self):
@@ -85,23 +256,71 @@ class Wire(Library):
     def copy(self):
         return Wire(init=self.next, changeable=self.changeable, name=self.name)
     def __repr__(self):
-        return super().__repr__() + f"[{'H' if self.next else ('?' if self.next is None else 'L')}]"
+        return f"{self.name}_{self.id:04X}" + f"[{'H' if self.next else ('?' if self.next is None else 'L')}]"
+
+
+_BITCHAR = bytes(ord('1') if v & 3 == 1 else ord('0') for v in range(256))
+_BITBYTE = bytes(1 if v == ord('1') else 0 for v in range(256))
+_PINMASK = bytes(v & _PINNED for v in range(256))
+_FRESH = bytes(v if v & _PINNED else 0 for v in range(256)) # constant wires kept, the others low
 
 
 class Bus(Library):
-    def __init__(self, nrbits):
+    def __init__(self, nrbits, store=None):
         super().__init__('Bus')
         self.nrbits = nrbits
-        self.binvec = list(Wire() for _ in range(self.nrbits))
+        if store is None:
+            store = WireStore()
+        start = store.alloc(nrbits)
+        self.binvec = list(Wire(store=store, index=start + i) for i in range(self.nrbits))
         self.labels = list(reversed(range(self.nrbits))) #@verify
+        self._reindex()
+    def _reindex(self):
+        """
+        Label-to-position map and, when the wires are consecutive in one store (always the case
+        for buses built here), the (store, start) span used to read and write them as one slice.
+        """
+        self._index = dict((l, i) for i, l in reversed(list(enumerate(self.labels))))
+        first = self.binvec[0] if self.nrbits > 0 else None
+        if not first is None and all(w.store is first.store and w.id == first.id + i for i, w in enumerate(self.binvec)):
+            self._span = (first.store, first.id)
+        else:
+            self._span = None
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reindex()
     def __getitem__(self, index):
-        return self.binvec[self.labels.index(index)] #@verify
+        return self.binvec[self.position(index)]
+    def __contains__(self, label):
+        return label in self._index
+    def position(self, label):
+        try:
+            return self._index[label]
+        except KeyError:
+            raise ValueError(f"{label} is not a label of {self}") from None
     def copy(self):
         aux = Bus(self.nrbits)
         aux.set_labels(*self.labels)
         return aux
+    def _on(self, store):
+        """
+        Same labels (and id) over the wires with the same ids in 'store'.
+        """
+        aux = Bus.__new__(Bus)
+        aux.name, aux.id, aux.created_by = self.name, self.id, self.created_by
+        aux.nrbits = self.nrbits
+        aux.binvec = list(Wire.at(store, w.id) for w in self.binvec)
+        aux.labels = list(self.labels)
+        aux._index = dict(self._index)
+        aux._span = None if self._span is None else (store, self._span[1])
+        return aux
     def set_label(self, index, label):
+        old = self.labels[index]
+        if self._index.get(old) == index:
+            del self._index[old]
         self.labels[index] = label
+        if not label in self._index or self._index[label] > index:
+            self._index[label] = index
     def set_labels(self, *args):
         if len(args) == 1 and type(args[0]) in [list, tuple]:
             args = args[0]
@@ -110,7 +329,25 @@ class Bus(Library):
                 self.set_label(i, l)
         else:
             self.error(f"wrong number of labels, expecting {self.nrbits}, not {args}.")
+    def _raw(self):
+        if self._span is None:
+            return bytes(w.store.values[w.id] for w in self.binvec)
+        store, start = self._span
+        return store.values[start:start + self.nrbits]
+    def _write(self, bits):
+        """
+        Writes one 0/1 byte per wire, in binvec order, keeping the non-changeable flags.
+        """
+        merged = (int.from_bytes(self._raw().translate(_PINMASK), 'big') | int.from_bytes(bits, 'big')).to_bytes(self.nrbits, 'big')
+        if self._span is None:
+            for w, v in zip(self.binvec, merged):
+                w.store.values[w.id] = v
+        else:
+            store, start = self._span
+            store.values[start:start + self.nrbits] = merged
     def _convert_to_binary(self, decimal, nrbits):
+        if decimal >= 0 and nrbits > 0:
+            return list(b == '1' for b in format(decimal, f'0{nrbits}b')[-nrbits:])
         binvec = list(True if b == '1' else False for b in bin(decimal)[2:])
         lb = len(binvec)
         if lb < nrbits:
@@ -127,11 +364,13 @@ class Bus(Library):
     def _convert_to_decimal(self, first=0, last=None):
         if last is None: last = len(self.binvec)
         else: last += 1
-        decimal = 0
-        for n, b in enumerate(reversed(self.binvec[first:last])):
-            if b.next:
-                decimal += 2**n
-        return decimal
+        bits = self._raw()[first:last].translate(_BITCHAR)
+        return int(bits, 2) if len(bits) > 0 else 0
+    def value(self):
+        """
+        Whole bus as a packed unsigned int, binvec[0] being the most significant bit.
+        """
+        return self._convert_to_decimal()
     def dec(self, first=0, last=None, signed=True):
         if last is None: last = len(self.binvec)-1
         decimal = self._convert_to_decimal(first, last)
@@ -140,13 +379,15 @@ class Bus(Library):
         return decimal
     def set_as(self, data):
         if type(data) == int:
-            aux = self._convert_to_binary(data, self.nrbits)
-            for i in range(self.nrbits):
-                self.binvec[i].next = aux[i]
+            if data >= 0 and self.nrbits > 0:
+                self._write(format(data, f'0{self.nrbits}b')[-self.nrbits:].encode().translate(_BITBYTE))
+            else:
+                aux = self._convert_to_binary(data, self.nrbits)
+                for i in range(self.nrbits):
+                    self.binvec[i].next = aux[i]
         elif type(data) == list and len(data) == self.nrbits:
             if type(data[0]) in [bool, int]:
-                for i in range(self.nrbits):
-                    self.binvec[i].next = True if data[i] == 1 else False
+                self._write(bytes(1 if data[i] == 1 else 0 for i in range(self.nrbits)))
             elif type(data[0]) == Wire:
                 for i in range(self.nrbits):
                     self.binvec[i].next = data[i].next
@@ -158,20 +399,32 @@ class Bus(Library):
     def get_wires(self):
         return self.binvec
     def str(self, sep='', order=None):
-        if order is None: order = self.labels
-        return sep.join(list('1' if b.next else '0' for b in \
-            list(self.binvec[self.labels.index(l)] for l in order)))
+        bits = self._raw().translate(_BITCHAR).decode()
+        if order is None:
+            return sep.join(bits)
+        return sep.join(bits[self.position(l)] for l in order)
 
 
 class Transistor(Library):
-    def __init__(self):
+    def __init__(self, store=None):
         super().__init__('Q')
-        self.ports = { 'B': Wire(), 'C': Wire(), 'E': Wire() }
+        if store is None:
+            store = WireStore()
+        self.ports = { 'B': Wire(store=store), 'C': Wire(store=store), 'E': Wire(store=store) }
         self.bridge_CE = False
     def __getitem__(self, index):
         return self.ports[index]
     def copy(self):
         return Transistor()
+    def _on(self, wire):
+        """
+        Same transistor over the wires given by 'wire' (a map from this transistor's wires).
+        """
+        aux = Transistor.__new__(Transistor)
+        Library.__init__(aux, 'Q')
+        aux.ports = dict((k, wire(w)) for k, w in self.ports.items())
+        aux.bridge_CE = False
+        return aux
     def logic(self):
         if self.ports['B'].next:
             self.bridge_CE = True
@@ -185,31 +438,101 @@ class Transistor(Library):
         return list(self.ports[l] for l in ['B', 'C', 'E'])
 
 
+class VectorSink:
+    """
+    Buffered file of test results, one row per vector with the input then the output bits:
+    '.csv' files hold a first line of labels, inputs and outputs split by '|', and comma
+    separated bits; any other extension is
+    binary, a header (magic, version, number of inputs and outputs, labels separated by newlines)
+    followed by the bits of every row packed most significant first, padded to whole bytes.
+    """
+    format_version = 1
+    _magic = b'ECSV'
+    buffer_size = 1 << 20
+    def __init__(self, filename, input_labels, output_labels):
+        self.labels = list(input_labels) + list(output_labels)
+        self.binary = not str(filename).endswith('.csv')
+        if self.binary:
+            self.file = open(filename, 'wb', buffering=VectorSink.buffer_size)
+            labels = '\n'.join(self.labels).encode()
+            self.file.write(struct.pack('<4sHHHI', VectorSink._magic, VectorSink.format_version,
+                len(input_labels), len(output_labels), len(labels)) + labels)
+            self.nrbytes = (len(self.labels) + 7) // 8
+            self.padding = 8*self.nrbytes - len(self.labels)
+        else:
+            self.file = open(filename, 'w', buffering=VectorSink.buffer_size)
+            self.file.write(','.join(input_labels) + '|' + ','.join(output_labels) + '\n')
+    @staticmethod
+    def read(filename, labels=None):
+        """
+        Rows of a binary file as tuples of bits: the input columns or, given 'labels', the columns
+        with those labels, in that order; see read_vectors().
+        """
+        with open(filename, 'rb') as f:
+            fmt = '<4sHHHI'
+            _, version, nrinputs, nroutputs, size = struct.unpack(fmt, f.read(struct.calcsize(fmt)))
+            if version > VectorSink.format_version:
+                raise Exception(f"{filename}: format version {version}, this simulator reads up to {VectorSink.format_version}.")
+            names = f.read(size).decode().split('\n')
+            columns = range(nrinputs) if labels is None else VectorSink._columns(filename, names, labels)
+            total = nrinputs + nroutputs
+            nrbytes = (total + 7) // 8
+            while True:
+                row = f.read(nrbytes)
+                if len(row) < nrbytes:
+                    return
+                bits = format(int.from_bytes(row, 'big') >> (8*nrbytes - total), f'0{total}b')
+                yield tuple(int(bits[i]) for i in columns)
+    @staticmethod
+    def _columns(filename, names, labels):
+        index = dict((l, i) for i, l in reversed(list(enumerate(names))))
+        missing = list(l for l in labels if not l in index)
+        if missing:
+            raise Exception(f"{filename}: no column for {', '.join(map(str, missing))}.")
+        return list(index[l] for l in labels)
+    def write(self, words, lanes):
+        """
+        Writes 'lanes' rows from the bitsliced 'words' (label -> word, bit j being row j).
+        """
+        columns = list(format(words[l], f'0{lanes}b')[::-1] for l in self.labels)
+        rows = list(''.join(c[j] for c in columns) for j in range(lanes))
+        if self.binary:
+            self.file.write(b''.join((int(r, 2) << self.padding).to_bytes(self.nrbytes, 'big') for r in rows))
+        else:
+            self.file.write(''.join(','.join(r) + '\n' for r in rows))
+    def close(self):
+        self.file.close()
+
+
 class Gate(Library):
+    bitslice_lanes = 4096 # input vectors evaluated per pass when testing combinational components
     def __init__(self, name, nrtransistors, input_labels, output_labels):
         super().__init__(name)
         if type(input_labels) == str:
             input_labels = [input_labels]
         if type(output_labels) == str:
             output_labels = [output_labels]
-        self.vcc = Wire(1, changeable=False, name='VCC')
-        self.gnd = Wire(0, changeable=False, name='GND')
+        self.store = WireStore()
+        self.vcc = Wire(1, changeable=False, name='VCC', store=self.store)
+        self.gnd = Wire(0, changeable=False, name='GND', store=self.store)
         self.clock = None
-        self.inputs = Bus(len(input_labels))
+        self.inputs = Bus(len(input_labels), self.store)
         self.inputs.set_labels(input_labels)
-        self.outputs = Bus(len(output_labels))
+        self.outputs = Bus(len(output_labels), self.store)
         self.outputs.set_labels(output_labels)
-        self.components = list(Transistor() for _ in range(nrtransistors))
+        self.components = list(Transistor(self.store) for _ in range(nrtransistors))
         self.connections = dict((w, set()) for w in self.get_wires())
         self.connections.update({self.vcc: set(), self.gnd: set()})
         self.inverted_outputs = dict((self.outputs[l], False) for l in self.outputs.labels) \
             if nrtransistors > 0 else None
         self.visited = None
+        self._switch = None
+        self._shape = None
         # self.clock = None
     def __getitem__(self, index):
-        if type(index) == int or index in self.inputs.labels:
+        if type(index) == int or index in self.inputs:
            return self.inputs[index] 
-        if type(index) == int or index in self.outputs.labels:
+        if type(index) == int or index in self.outputs:
            return self.outputs[index]
     def has_clock(self):
         return not self.clock is None
@@ -223,18 +546,131 @@ class Gate(Library):
             wires += [self.clock]
         return wires
     def nrtransistors(self):
-        return len(self.components)
+        return len(self._source().components)
+    def __getattr__(self, name):
+        """
+        Only reached for attributes not set: a flyweight copy builds its structure from its
+        definition on first use, and keeps it as '_frozen' for its own copies until a structural
+        change (see _thaw).
+        """
+        definition = self.__dict__.get('_definition')
+        if definition is None or name.startswith('__'):
+            raise AttributeError(name)
+        del self._definition
+        self._frozen = definition
+        self._build(definition)
+        return getattr(self, name)
+    def _source(self):
+        """
+        Component holding the structure: the shared definition of a flyweight copy not built yet,
+        'self' otherwise.
+        """
+        return self.__dict__.get('_definition', self)
     def copy(self):
-        acopy = Gate(self.name, self.nrtransistors(), self.inputs.labels, self.outputs.labels)
-        wires_dict = dict((ws, wc) for ws, wc in zip(self.get_wires(), acopy.get_wires()))
-        for k, v in self.connections.items():
-            aux = set(wires_dict[w] for w in v)
-            acopy.connections[wires_dict[k]] = aux
-        for k, v in self.inverted_outputs.items():
-            acopy.inverted_outputs[wires_dict[k]] = v
+        """
+        Flyweight copy: owns a fresh store (its wire values) and handles to its ports, and shares an
+        immutable definition, built on first use (see __getattr__). Copying a built component
+        first freezes its structure into a new definition, kept until a structural change.
+        """
+        definition = self.__dict__.get('_definition', self.__dict__.get('_frozen'))
+        if definition is None:
+            definition = self._instance()
+            definition._build(self)
+            self._frozen = definition
+        acopy = self._instance()
+        acopy._definition = definition
+        return acopy
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop('_frozen', None)
+        return state
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if not 'store' in state: # pickled before WireStore existed
+            self._adopt_wires()
+    def _thaw(self):
+        """
+        Forgets the frozen definition copies are made from; called by every structural change.
+        """
+        self.__dict__.pop('_frozen', None)
+    def _adopt_wires(self):
+        """
+        Moves the standalone wires of a component pickled before WireStore existed into a store of
+        its own, in the order new components use (VCC, GND, inputs, outputs, clock, then the
+        others); wires already taken by a component (its ports) are left there, except the clock
+        a child shares with this one.
+        """
+        wires = [self.vcc, self.gnd] + self.inputs.binvec + self.outputs.binvec
+        if self.has_clock():
+            wires.append(self.clock)
+        others = list(w for q in self.components if isinstance(q, Transistor) for w in q.get_wires())
+        others += list(w for k, v in self.connections.items() for w in [k, *v])
+        wires = list(dict.fromkeys(wires + list(w for w in others if len(w.store) == 1)))
+        self.store = WireStore()
+        self.store.alloc(len(wires))
+        for i, w in enumerate(wires):
+            self.store.values[i] = w.store.values[w.id]
+            if w.name != 'Wire':
+                self.store.names[i] = w.name
+            w.store, w.id = self.store, i
+        self.inputs._reindex()
+        self.outputs._reindex()
+        for name in ['visited', '_switch', '_shape']:
+            self.__dict__.setdefault(name, None)
+        return self.store
+    def _instance(self):
+        """
+        Same class over a fresh copy of the store (constant wires kept, the others low); VCC, GND,
+        ports and clock are handles to the same ids.
+        """
+        store = self.__dict__.get('store')
+        if store is None: # built from a pickle older than WireStore, see __setstate__
+            store = self._adopt_wires()
+        acopy = object.__new__(type(self))
+        Library.__init__(acopy, self.name)
+        acopy.store = WireStore()
+        acopy.store.values, acopy.store.names = bytearray(store.values.translate(_FRESH)), dict(store.names)
+        acopy.vcc, acopy.gnd = Wire.at(acopy.store, self.vcc.id), Wire.at(acopy.store, self.gnd.id)
+        acopy.inputs, acopy.outputs = self.inputs._on(acopy.store), self.outputs._on(acopy.store)
+        acopy.clock = None
+        if self.has_clock():
+            # a clock taken over by a parent (see _replace_clock) lives elsewhere: use the own one
+            index = self.clock.id if self.clock.store is self.store else 2 + self.inputs.nrbits + self.outputs.nrbits
+            acopy.clock = Wire.at(acopy.store, index) if index < len(acopy.store) else Wire(store=acopy.store)
         return acopy
+    def _ports(self):
+        return [self.vcc, self.gnd] + self.inputs.binvec + self.outputs.binvec
+    def _unchanged(self):
+        """
+        True for a flyweight circuit not built yet whose own wires (clock included) still hold its
+        definition's values: then it flattens, and hashes, exactly as the definition does.
+        """
+        source = self._source()
+        if source is self or not isinstance(self, Circuit) or self.store.values != source.store.values:
+            return False
+        return not self.has_clock() or self.clock.store.values[self.clock.id] == source.clock.store.values[source.clock.id]
+    def _build(self, source):
+        """
+        Transistors, connections and inverted outputs of 'source', an equivalent component whose
+        wires have the same ids in its own store.
+        """
+        handles = dict((w.id, w) for w in self._ports())
+        def wire(w):
+            h = handles.get(w.id)
+            if h is None:
+                h = handles[w.id] = Wire.at(self.store, w.id)
+            return h
+        self.components = list(q._on(wire) for q in source.components)
+        self.connections = dict((wire(k), set(wire(w) for w in v)) for k, v in source.connections.items())
+        self.inverted_outputs = dict((wire(k), v) for k, v in source.inverted_outputs.items())
+        self.__dict__.setdefault('visited', None)
+        self._switch = getattr(source, '_switch', None)
+        self._shape = getattr(source, '_shape', None)
     def change_node(self, old_node, new_node):
         if old_node in self.connections:
+            self._switch = None
+            self._shape = None
+            self._thaw()
             self.connections[new_node] = self.connections[old_node].copy()
             del self.connections[old_node]
             for k, v in self.connections.items():
@@ -244,11 +680,20 @@ class Gate(Library):
             for c in self.components:
                 c.change_node(old_node, new_node)
     def connect_nodes_unidirecional(self, wireFrom, wireTo):
+        self._switch = None
+        self._shape = None
+        self._thaw()
         self.connections[wireFrom].add(wireTo)
     def connect_nodes(self, wireA, wireB):
+        self._switch = None
+        self._shape = None
+        self._thaw()
         self.connections[wireA].add(wireB)
         self.connections[wireB].add(wireA)
     def disconnect_nodes(self, wireA, wireB):
+        self._switch = None
+        self._shape = None
+        self._thaw()
         if wireB in self.connections[wireA]: self.connections[wireA].remove(wireB)
         if wireA in self.connections[wireB]: self.connections[wireB].remove(wireA)
     def connect(self, idxQA, portQA, idxQB, portQB):
@@ -269,33 +714,47 @@ class Gate(Library):
     def set_as_gnd(self, idxQ, portQ):
         self.connect_nodes(self.components[idxQ].ports[portQ], self.gnd)
     def is_input(self, label):
-        return label in self.inputs.labels
+        return label in self.inputs
     def is_output(self, label):
-        return label in self.outputs.labels
+        return label in self.outputs
     def _support_to_navigation(self):
-        if self.visited is None:
-            self.visited = dict((w, False) for w in self.get_wires())
-        else:
-            for k in self.visited.keys():
-                self.visited[k] = False
+        """
+        Fresh visited set for one walk, so its cost follows the wires actually reached
+        rather than every wire of the component.
+        """
+        self.visited = set()
     def _is_short_circuit(self, origin):
         if origin == self.gnd:
             return True
-        self.visited[origin] = True
-        for w in self.connections[origin]:
-            if not self.visited[w]:
-                aux = self._is_short_circuit(w)
-                if aux: return True
+        self.visited.add(origin)
+        stack = [iter(self.connections[origin])]
+        while stack:
+            for w in stack[-1]:
+                if not w in self.visited:
+                    if w == self.gnd:
+                        return True
+                    self.visited.add(w)
+                    stack.append(iter(self.connections[w]))
+                    break
+            else:
+                stack.pop()
         return False
     def is_short_circuit(self):
         self._support_to_navigation()
         return self._is_short_circuit(self.vcc)
     def _propagate(self, origin):
-        self.visited[origin] = True
-        for w in self.connections[origin]:
-            if not self.visited[w]:
-                w.set_as(origin)
-                self._propagate(w)
+        self.visited.add(origin)
+        stack = [(origin, iter(self.connections[origin]))]
+        while stack:
+            node, neighbours = stack[-1]
+            for w in neighbours:
+                if not w in self.visited:
+                    w.set_as(node)
+                    self.visited.add(w)
+                    stack.append((w, iter(self.connections[w])))
+                    break
+            else:
+                stack.pop()
     def propagate(self, origin):
         self._support_to_navigation()
         self._propagate(origin)
@@ -316,15 +775,367 @@ class Gate(Library):
             q.logic()
             if q.bridge_CE: self.connect_nodes(q['C'], q['E'])
             else: self.disconnect_nodes(q['C'], q['E'])
+    def _compile_switch(self):
+        """
+        Precomputes, from the fixed connections and as wire ids in the store, the wires each input
+        drives (in label order), each transistor as (position, base, collector group, emitter
+        group), the VCC/GND groups and each output with its inversion.
+        """
+        find = self._static_groups()
+        groups = dict()
+        def group(w):
+            return groups.setdefault(find(w), len(groups))
+        drive = list()
+        for l in self.inputs.labels:
+            root = find(self.inputs[l])
+            drive.append((self.inputs[l].id, list(w.id for w in self.connections if w != self.inputs[l] and find(w) is root)))
+        transistors = list((k, q['B'].id, group(q['C']), group(q['E'])) for k, q in enumerate(self.components))
+        outputs = list((self.outputs[l].id, bool(self.inverted_outputs[self.outputs[l]])) for l in self.outputs.labels)
+        self._switch = (drive, transistors, group(self.vcc), group(self.gnd), len(groups), outputs)
+        return self._switch
+    def switch_level(self):
+        """
+        Switch-level solution for the current base values: one union-find partition of the nodes
+        (fixed connections plus the C-E bridges of conducting transistors), without touching
+        'connections'; returns True when VCC and GND end up in the same part (short circuit).
+        """
+        source = self._source()
+        switch = getattr(source, '_switch', None)
+        _, transistors, vcc, gnd, nrgroups, _ = switch if not switch is None else source._compile_switch()
+        values = self.store.values
+        components = self.components if source is self else None
+        parent = list(range(nrgroups))
+        def find(g):
+            while parent[g] != g:
+                parent[g] = parent[parent[g]]
+                g = parent[g]
+            return g
+        for k, base, c, e in transistors:
+            bridge = values[base] & 3 == 1
+            if not components is None:
+                components[k].bridge_CE = bridge
+            if bridge:
+                rc, re = find(c), find(e)
+                if rc != re: parent[rc] = re
+        return find(vcc) == find(gnd)
     def run(self):
-        for lbl in self.inputs.labels:
-            self.propagate(self.inputs[lbl])
-        self.logic()
-        for l in self.outputs.labels:
-            if self.is_short_circuit():
-                self.outputs[l].next = not self.inverted_outputs[self.outputs[l]]
+        """
+        Reads and writes the store through the compiled switch, so flyweight copies run on their
+        definition's tables without being built.
+        """
+        source = self._source()
+        switch = getattr(source, '_switch', None)
+        if switch is None:
+            switch = source._compile_switch()
+        drive, outputs = switch[0], switch[5]
+        values = self.store.values
+        for origin, wires in drive:
+            v = values[origin] & 3
+            for w in wires:
+                if not values[w] & _PINNED:
+                    values[w] = v
+        short = self.switch_level()
+        for w, inverted in outputs:
+            values[w] = (values[w] & _PINNED) | (short != inverted)
+    def _static_groups(self):
+        """
+        Returns a 'find' function over the partition of nodes joined by fixed connections,
+        i.e. ignoring the C-E bridges that logic() switches on and off.
+        """
+        parent = dict()
+        def find(w):
+            root = parent.setdefault(w, w)
+            while parent[root] is not root:
+                root = parent[root]
+            while parent[w] is not root:
+                parent[w], w = root, parent[w]
+            return root
+        bridges = set()
+        for q in self.components:
+            bridges.update({(q['C'], q['E']), (q['E'], q['C'])})
+        for k, v in self.connections.items():
+            for w in v:
+                if not (k, w) in bridges:
+                    ra, rb = find(k), find(w)
+                    if ra is not rb: parent[ra] = rb
+        return find
+    def switch_function(self):
+        """
+        Conduction function of the transistor network as a sum of products: each product is a
+        tuple of input positions which, all high, bridge VCC to GND (the short circuit read by run()).
+        An empty product means VCC and GND are always bridged.
+        """
+        find = self._static_groups()
+        position = dict((find(self.inputs[l]), i) for i, l in enumerate(self.inputs.labels))
+        edges = list()
+        for q in self.components:
+            i = position.get(find(q['B']))
+            if not i is None:
+                edges.append((find(q['C']), find(q['E']), i))
+        source, target = find(self.vcc), find(self.gnd)
+        if source is target:
+            return ((),)
+        products = set()
+        stack = [(source, frozenset(), frozenset([source]))]
+        while stack:
+            node, used, seen = stack.pop()
+            for a, b, i in edges:
+                if a is node: nxt = b
+                elif b is node: nxt = a
+                else: continue
+                if nxt in seen: continue
+                if nxt is target: products.add(used | {i})
+                else: stack.append((nxt, used | {i}, seen | {nxt}))
+        minimal = list(p for p in products if not any(o < p for o in products))
+        return tuple(sorted(tuple(sorted(p)) for p in minimal))
+    def digest(self):
+        """
+        Content hash of the component: labels, wiring, constant wires and, for circuits, the
+        digests of its components; equal digests flatten to the same Netlist, up to the state.
+        """
+        return Netlist._digests(self)[id(self)]
+    def _structure(self):
+        if self._source() is not self:
+            return self._source()._structure()
+        if getattr(self, '_shape', None) is None:
+            wires = [self.vcc, self.gnd] + list(self.inputs[l] for l in self.inputs.labels) + \
+                list(self.outputs[l] for l in self.outputs.labels)
+            for q in self.components:
+                wires += list(q[p] for p in 'BCE')
+            inverted = tuple(bool(self.inverted_outputs[self.outputs[l]]) for l in self.outputs.labels)
+            self._shape = self._wiring(wires, (inverted,))
+        return self._shape
+    def _digest(self, digests):
+        values = self.store.values[:2 + self.inputs.nrbits + self.outputs.nrbits].translate(_FRESH)
+        return hashlib.sha1(self._structure() + values).hexdigest()
+    def _wiring(self, wires, extra):
+        """
+        Structure part of digest(), kept in '_shape' until the connections change.
+        """
+        index = dict()
+        for w in wires:
+            index.setdefault(w, len(index))
+        pairs = sorted((index.setdefault(k, len(index)), index.setdefault(w, len(index)))
+            for k, v in self.connections.items() for w in v)
+        content = repr((type(self).__name__, self.name, self.inputs.labels, self.outputs.labels, pairs) + extra)
+        return hashlib.sha1(content.encode()).digest()
+    def compile(self, mode='levelized', optimize=False):
+        """
+        Flattens the component down to its leaf gates, giving each net an integer id and fixing
+        a single evaluation order; returns a Netlist whose run(inputs) matches self.run().
+        'mode' selects the Netlist engine, see Netlist.set_mode(). Results are cached by digest()
+        in memory and under Library.dirpath / 'cache', see Library.cache_info().
+        'optimize=True' also simplifies the result, see Netlist.optimize().
+        """
+        net = Netlist.flatten(self, store=True)
+        net.set_mode(mode)
+        if optimize:
+            net.optimize()
+        return net
+    def codegen(self):
+        """
+        Compiles a combinational component into straight-line Python: one local per net and one
+        bitwise expression per leaf gate output, read off the truth table of the leaf's transistor
+        network. Returns a module with run(inputs), inputs and outputs as packed ints (first label
+        most significant), and run_words(words, nrvectors), bitsliced as Netlist.run_words().
+        The source is cached by digest() (and the values of undriven nets, folded in) in memory
+        and as Library.dirpath / '<name>.py'; test_all() and test_set() evaluate through it.
+        """
+        net = self.compile()
+        if not net.is_combinational():
+            self.error("codegen needs a combinational component, try Netlist.run_cycles().")
+        return self._codegen(net)
+    def _codegen(self, net):
+        driven, inputs = net.driven(), set(net.inputs)
+        floating = ''.join(str(net.state[n]) for n in range(net.nrnets) \
+            if not (n in net.consts or n in driven or n in inputs))
+        key = self.digest() + ('' if floating == '' else f'-{floating}')
+        module = Library._recall(Netlist._generated, key)
+        if not module is None:
+            Library.counters['codegen hits'] += 1
+            return module
+        path = Library.dirpath / f'{self.name}.py'
+        header = f'# ecs_simulator codegen {Netlist.format_version} {key}\n'
+        source = None
+        if os.path.isfile(path):
+            with open(path) as f:
+                source = f.read()
+        if not source is None and source.startswith(header):
+            Library.counters['codegen disk hits'] += 1
+        else:
+            Library.counters['codegen misses'] += 1
+            source = header + net._generate(self._truth_tables(net.types))
+            os.makedirs(path.parent, exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(source)
+        module = ModuleType(self.name)
+        exec(compile(source, str(path), 'exec'), module.__dict__)
+        Library._remember(Netlist._generated, key, module)
+        return module
+    def _truth_tables(self, types):
+        """
+        Per entry of 'types' (see Netlist), one (products, inverted) per output, taken from the
+        truth table of a leaf gate of that type below the component: the output is the sum of its
+        minimal true rows (as tuples of input positions) or, inverted, of its minimal false rows.
+        Types with no such leaf, or not monotone, keep their switch function.
+        """
+        index = dict((t, i) for i, t in enumerate(types))
+        leaves, seen, stack = dict(), set(), [self]
+        while stack and len(leaves) < len(types):
+            source = stack.pop()._source()
+            if id(source) in seen:
+                continue
+            seen.add(id(source))
+            if isinstance(source, Circuit):
+                stack.extend(source.components)
+                continue
+            inverted = tuple(bool(source.inverted_outputs[source.outputs[l]]) for l in source.outputs.labels)
+            t = index.get((source.name, source.switch_function(), inverted, source.nrtransistors()))
+            if not t is None:
+                leaves.setdefault(t, source)
+        tables = list()
+        for t, (_, products, inverted, _) in enumerate(types):
+            functions = Gate._leaf_functions(leaves[t]) if t in leaves else None
+            tables.append(functions if not functions is None else list((products, inv) for inv in inverted))
+        return tables
+    @staticmethod
+    def _leaf_functions(leaf):
+        """
+        Runs a copy of the leaf gate over every input row; returns its outputs as in
+        _truth_tables(), or None if one of them is neither increasing nor decreasing.
+        """
+        gate = leaf.copy()
+        values, nin = gate.store.values, gate.inputs.nrbits
+        ins = list(gate.inputs[l].id for l in gate.inputs.labels)
+        outs = list(gate.outputs[l].id for l in gate.outputs.labels)
+        rows, bits = 2**nin, list(1 << b for b in range(nin))
+        ons = list(set() for _ in outs)
+        for row in range(rows):
+            for i, w in enumerate(ins):
+                values[w] = row >> (nin - 1 - i) & 1
+            gate.run()
+            for k, w in enumerate(outs):
+                if values[w] & 1:
+                    ons[k].add(row)
+        functions = list()
+        for on in ons:
+            for f, inv in ((on, False), (set(range(rows)) - on, True)):
+                if all(r | b in f for r in f for b in bits):
+                    minimal = list(r for r in f if not any(r & b and r ^ b in f for b in bits))
+                    functions.append((tuple(sorted(tuple(i for i in range(nin) if r >> (nin - 1 - i) & 1) \
+                        for r in minimal)), inv))
+                    break
             else:
-                self.outputs[l].next = self.inverted_outputs[self.outputs[l]]
+                return None
+        return functions
+    def _stores(self):
+        """
+        Store of the component and of every component below it (built if needed), depth first.
+        """
+        stores, stack = list(), [self]
+        while stack:
+            c = stack.pop()
+            stores.append(c.store)
+            if isinstance(c, Circuit):
+                stack.extend(reversed(c.components))
+        return stores
+    def snapshot(self):
+        """
+        Every wire value of the hierarchy as one bytes object, to restore() later; cheaper than
+        copy() or save(), which also clone the structure.
+        """
+        return b''.join(bytes(store.values) for store in self._stores())
+    def restore(self, snapshot):
+        stores = self._stores()
+        if sum(len(store) for store in stores) != len(snapshot):
+            self.error("snapshot of another structure.")
+        start = 0
+        for store in stores:
+            store.values[:] = snapshot[start:start + len(store)]
+            start += len(store)
+    def fork(self, stimuli):
+        """
+        Runs, from the current state, len(stimuli) independent clocked runs at once on the
+        compiled netlist, see Netlist.fork(); the component itself is not changed.
+        """
+        return self.compile().fork(stimuli)
+    def check_against(self, reference, unsigned=[], order=None):
+        """
+        Symbolic check of a combinational component against an arithmetic model: 'reference' gets,
+        as in test_arithm(), one keyword per input bus prefix, bound to a Word (signed unless the
+        prefix is in 'unsigned'), and returns the value of the output bus (or a dict, or a tuple
+        in label order, for several), computed with +, -, *, &, |, ^, ~, << and >>, modulo the
+        bus width:
+            ex. Add16.check_against(lambda a, b: a + b)
+        Returns None when every output matches, otherwise a counterexample, the input bits
+        ordered as inputs.labels. 'order' as in equivalent().
+        """
+        net = self.compile()
+        bdd, variables = BDD.over(BDD.interleaved(net.input_labels) if order is None else order)
+        outputs = dict(zip(net.output_labels, net.symbolic(bdd, list(variables[l] for l in net.input_labels))))
+        operands = dict((p, Word(bdd, list(variables[l] for l in reversed(labels)), not p in unsigned)) \
+            for p, labels in group_by_prefix(self.inputs.labels).items())
+        result = reference(**operands)
+        groups = group_by_prefix(self.outputs.labels)
+        if type(result) != dict:
+            result = dict(zip(groups, result if type(result) in [tuple, list] else [result]))
+        if set(result) != set(groups):
+            self.error(f"the reference returns {', '.join(result)}, expecting {', '.join(groups)}.")
+        for p, labels in groups.items():
+            expected = result[p] if isinstance(result[p], Word) else Word.constant(bdd, result[p])
+            for k, l in enumerate(reversed(labels)):
+                diff = bdd.apply('xor', outputs[l], expected.bit(k))
+                if diff != 0:
+                    return bdd.counterexample(diff, variables, self.inputs.labels)
+        return None
+    def fault_simulate(self, vectors=None, drop=True):
+        """
+        Stuck-at fault coverage of a combinational component for 'vectors' (ordered as
+        inputs.labels; default every input vector), see Netlist.fault_simulate().
+        """
+        if vectors is None:
+            vectors = itertools.product((0, 1), repeat=self.inputs.nrbits)
+        return self.compile().fault_simulate(vectors, drop=drop)
+    def run_batch(self, inputs):
+        """
+        Evaluates every row of an (N, inputs.nrbits) array of bits, ordered as inputs.labels, and
+        returns the (N, outputs.nrbits) array of results, ordered as outputs.labels;
+        needs NumPy and a combinational component.
+        """
+        net = self.compile()
+        if not net.is_combinational():
+            self.error("run_batch needs a combinational component, try clock_next().")
+        return net.run_batch(inputs)
+    def run_arithm_batch(self, unsigned=[], **kwargs):
+        """
+        Batch counterpart of test_arithm: each keyword is an input bus prefix bound to an array of
+        integers (inputs not given keep their current value); returns a dict with an array of
+        integers per output bus prefix, signed unless the prefix is in 'unsigned' (up to 62 bits).
+        """
+        if np is None:
+            self.error("run_arithm_batch needs NumPy.")
+        operands = dict((k, np.atleast_1d(np.asarray(v, dtype=np.int64))) for k, v in kwargs.items())
+        nrows = max(len(v) for v in operands.values())
+        bits = np.tile(np.array([1 if self.inputs[l].next else 0 for l in self.inputs.labels], dtype=np.uint8), (nrows, 1))
+        for k, labels in group_by_prefix(self.inputs.labels).items():
+            if not k in operands: continue
+            nrbits = len(labels)
+            value = np.broadcast_to(operands[k], (nrows,))
+            negative = value < 0
+            value = np.where(negative, value + 2**nrbits, value)
+            value = np.where(negative & (value < 2**(nrbits-1)), value + 2**(nrbits-1), value)
+            for j, l in enumerate(labels):
+                bits[:, self.inputs.position(l)] = (value >> (nrbits - 1 - j)) & 1
+        results = self.run_batch(bits).astype(np.int64)
+        outputs = dict()
+        for p, labels in group_by_prefix(self.outputs.labels).items():
+            nrbits = len(labels)
+            columns = results[:, list(self.outputs.position(l) for l in labels)]
+            value = columns @ (np.int64(1) << np.arange(nrbits - 1, -1, -1, dtype=np.int64))
+            if not p in unsigned:
+                value -= columns[:, 0] << nrbits
+            outputs[p] = value
+        return outputs
     def header(self):
         return f"{self} : I/O {self.inputs.nrbits}⨉{self.outputs.nrbits} [#Q {self.nrtransistors()}]"
     def info(self):
@@ -364,69 +1175,208 @@ class Gate(Library):
             input_labels = label_display_order
             output_labels = self.outputs.labels
         return input_labels, output_labels
-    def test_all(self, label_display_order=None, compact=False, has_clock=False):
+    @staticmethod
+    def _counter_word(bit, base, lanes):
+        """
+        Bitsliced word of 'bit' for the counter values base, base+1, ..., base+lanes-1
+        ('lanes' is a power of two and 'base' a multiple of it).
+        """
+        half = 1 << bit
+        if half >= lanes:
+            return (1 << lanes) - 1 if (base >> bit) & 1 else 0
+        block = ((1 << half) - 1) << half
+        return block * (((1 << lanes) - 1) // ((1 << 2*half) - 1))
+    def _bitsliced_batches(self, net, batches):
+        """
+        Evaluates each (words, lanes) of 'batches' in a single pass of the code generated from
+        'net' (see codegen()); 'words' maps input labels to bitsliced words, missing labels keep
+        their current value. Yields (words, lanes, elapsed), 'words' now also holding the output
+        words.
+        """
+        run_words = self._codegen(net).run_words
+        for words, lanes in batches:
+            mask = (1 << lanes) - 1
+            t = time.time()
+            outputs = run_words(list(words.get(l, mask if net.state[n] else 0) \
+                for l, n in zip(net.input_labels, net.inputs)), lanes)
+            elapsed = time.time() - t
+            words.update(zip(net.output_labels, outputs))
+            yield words, lanes, elapsed
+    def _object_batches(self, cases, input_labels, indexes, has_clock):
+        """
+        Runs (or clocks) the component itself once per case, yielding (words, 1, elapsed) with
+        the bits read back from its buses.
+        """
+        for case in cases:
+            inputs = dict((k, v) for k, v in zip(input_labels, list(case[i] for i in indexes)))
+            t = time.time()
+            self.set_input_values(inputs)
+            if not has_clock:
+                self.run()
+            else:
+                self.clock_next()
+            elapsed = time.time() - t
+            words = dict(zip(self.inputs.labels, self.inputs.str()))
+            words.update(zip(self.outputs.labels, self.outputs.str()))
+            yield dict((l, int(v)) for l, v in words.items()), 1, elapsed
+    def _case_batches(self, cases, input_labels, indexes, has_clock):
+        """
+        Batches of any iterable of cases, ordered as inputs.labels: bitsliced chunks of
+        Gate.bitslice_lanes cases for combinational components (the component is then left with
+        the last case applied), one case at a time otherwise.
+        """
+        def checked(case):
+            if len(case) != self.inputs.nrbits: self.error("case with mismatch number of entries.")
+            return case
+        net = None if has_clock else self.compile()
+        if net is None or not net.is_combinational():
+            yield from self._object_batches(map(checked, cases), input_labels, indexes, has_clock)
+            return
+        last, cases = None, iter(cases)
+        def chunks():
+            nonlocal last
+            while True:
+                chunk = list(map(checked, itertools.islice(cases, Gate.bitslice_lanes)))
+                if len(chunk) == 0:
+                    return
+                last = chunk[-1]
+                yield dict((l, int(''.join('0' if case[i] == 0 else '1' for case in reversed(chunk)), 2)) \
+                    for l, i in zip(input_labels, indexes)), len(chunk)
+        yield from self._bitsliced_batches(net, chunks())
+        if not last is None:
+            self.set_input_values(dict((l, last[i]) for l, i in zip(input_labels, indexes)))
+            self.run()
+    def _report(self, batches, input_labels, output_labels, compact, sink, quiet):
+        """
+        Prints (or writes to 'sink', or, if 'quiet', skips) the rows of 'batches', then the mean
+        elapsed time per vector (the total time and vectors per second without a table).
+        """
+        table = sink is None and not quiet
+        if table:
+            len_labels = self._test_header(input_labels, output_labels, compact)
+        writer = None if sink is None else VectorSink(sink, input_labels, output_labels)
+        count, elapsed = 0, 0
+        try:
+            for words, lanes, t in batches:
+                count, elapsed = count + lanes, elapsed + t
+                if not writer is None:
+                    writer.write(words, lanes)
+                elif table:
+                    Gate._print_bitsliced(words, lanes, input_labels, output_labels, compact)
+        finally:
+            if not writer is None:
+                writer.close()
+        if table:
+            print('-'*len_labels)
+            print(f'Mean elapsed time: {elapsed/max(count, 1)*1000:.2f} ms\n')
+        else:
+            print('\n' + self.header() + f' : {count} vectors' + ('' if sink is None else f' written to {sink}'))
+            rate = f' ({count/elapsed:,.0f} vectors/s)' if elapsed > 0 else ''
+            print(f'Elapsed time: {elapsed*1000:.2f} ms' + rate + '\n')
+    @staticmethod
+    def _print_bitsliced(words, lanes, input_labels, output_labels, compact):
+        """
+        Prints one line per vector of the bitsliced 'words' (label -> word, inputs and outputs).
+        """
+        def columns(labels):
+            return list(format(words[l], f'0{lanes}b')[::-1] for l in labels)
+        columns_in, columns_out = columns(input_labels), columns(output_labels)
+        sep = ' ' if compact else ', '
+        for j in range(lanes):
+            print(' ' + sep.join(c[j] for c in columns_in) + ' | ' + sep.join(c[j] for c in columns_out))
+    def test_all(self, label_display_order=None, compact=False, has_clock=False, workers=None, sink=None, quiet=False):
         """
         'label_display_order' changes only visualization, not original label ordering;
         in case of only reordering input labels, 'label_display_order' is a list with all labels in desired order;
         in case of reordering both input and output labels, 'label_display_order' is a tuple with two lists, each with respective labels in desired order.
         'compact=True' will print labels each in a single column.
+        'workers=N' evaluates a combinational component in N processes, see sweep().
+        'sink' is a file (see VectorSink) receiving the rows instead of the screen; 'quiet=True' skips
+        them, only the number of vectors, the total elapsed time and vectors per second are printed.
         """
         input_labels, output_labels = self._labels_order(label_display_order)
-        len_labels = self._test_header(input_labels, output_labels, compact)
         dimension = len(input_labels)
-        min_count, max_count = 0, 1
-        counter = [min_count]*dimension
-        elapsed = list()
-        while True:
-            inputs = dict((k, v) for k, v in zip(input_labels, reversed(counter)))
+        net = None if has_clock else self.compile()
+        if net is None or not net.is_combinational():
+            cases = itertools.product((0, 1), repeat=dimension)
+            self._report(self._object_batches(cases, input_labels, range(dimension), has_clock), \
+                input_labels, output_labels, compact, sink, quiet)
+            return
+        def counters(start, stop):
+            return dict((l, Gate._counter_word(dimension - 1 - i, start, stop - start)) for i, l in enumerate(input_labels))
+        def swept():
             t = time.time()
-            self.set_input_values(inputs)
-            if not has_clock:
-                self.run()
-            else:
-                self.clock_next()
-            elapsed.append(time.time() - t)
-            if compact:
-                print(' ' + self.inputs.str(' ', order=input_labels) + ' | ' + self.outputs.str(' ', order=output_labels))
-            else:
-                print(' ' + self.inputs.str(', ', order=input_labels) + ' | ' + self.outputs.str(', ', order=output_labels))
-            counter[0] += 1
-            for i in range(len(counter)-1):
-                if counter[i] > max_count:
-                    counter[i] = min_count
-                    counter[i+1] += 1
-            if counter[-1] > max_count:
-                break
-        print('-'*len_labels)
-        print(f'Mean elapsed time: {sum(elapsed)/len(elapsed)*1000:.2f} ms\n')
-    def test_set(self, cases, label_display_order=None, compact=False, has_clock=False):
+            for start, stop, outputs in self.sweep(workers, order=input_labels):
+                words = counters(start, stop)
+                words.update(zip(net.output_labels, outputs))
+                yield words, stop - start, time.time() - t
+                t = time.time()
+        if workers is None:
+            total = 2**dimension
+            lanes = min(total, Gate.bitslice_lanes)
+            batches = self._bitsliced_batches(net, ((counters(base, base + lanes), lanes) for base in range(0, total, lanes)))
+        else:
+            batches = swept()
+        self._report(batches, input_labels, output_labels, compact, sink, quiet)
+        self.set_input_values(dict((l, 1) for l in input_labels))
+        self.run()
+    def sweep(self, workers=None, reference=None, order=None, start=0, stop=None, chunk=None):
+        """
+        Exhaustive evaluation of a combinational component: input vectors are numbered in binary
+        over inputs.labels (or the labels in 'order'), most significant first, and the numbers
+        start, ..., stop-1 (default all) are split in contiguous ranges of 'chunk' vectors, evaluated
+        by 'workers' processes (default os.cpu_count(); 1 evaluates here), each reading the compiled
+        netlist once from Library.dirpath / 'cache' and taking the current state from here. Yields (start, stop, result) per range, in
+        order, where result is the one returned by Netlist.sweep_range(): packed output words or,
+        given 'reference', the number of mismatches and the first one ('reference' is sent to the
+        workers, so it has to be a module-level function).
         """
-        'cases' MUST respect the original label ordering.
+        net = self.compile()
+        if not net.is_combinational():
+            self.error("sweep needs a combinational component, try clock_next().")
+        order = self.inputs.labels if order is None else order
+        stop = 2**len(order) if stop is None else stop
+        chunk = 16*Gate.bitslice_lanes if chunk is None else chunk
+        ranges = ((a, min(a + chunk, stop)) for a in range(start, stop, chunk))
+        workers = os.cpu_count() if workers is None else workers
+        if workers == 1:
+            for a, b in ranges:
+                yield a, b, net.sweep_range(a, b, order, reference)
+            return
+        filename = f'cache/{self.digest()}.net'
+        with ProcessPoolExecutor(workers, initializer=Netlist._sweep_init, initargs=(Library.dirpath, filename, bytes(net.state))) as pool:
+            pending = deque()
+            for a, b in ranges:
+                pending.append((a, b, pool.submit(Netlist._sweep_task, a, b, order, reference)))
+                if len(pending) >= 2*workers:
+                    a, b, future = pending.popleft()
+                    yield a, b, future.result()
+            while pending:
+                a, b, future = pending.popleft()
+                yield a, b, future.result()
+    def test_set(self, cases, label_display_order=None, compact=False, has_clock=False, sink=None, quiet=False):
+        """
+        'cases' MUST respect the original label ordering; any iterable works (a list, a generator,
+        read_vectors('file')), it is consumed lazily.
         'label_display_order' doesn't change the input order for case tests, only their visualization;
         in case of only reordering input labels, 'label_display_order' is a list with all labels in desired order;
         in case of reordering both input and output labels, 'label_display_order' is a tuple with two lists, each with respective labels in desired order.
         'compact=True' will print labels each in a single column.
+        'sink' and 'quiet' as in test_all().
         """
         input_labels, output_labels = self._labels_order(label_display_order)
-        indexes = list(self.inputs.labels.index(l) for l in input_labels)
-        len_labels = self._test_header(input_labels, output_labels, compact)
-        elapsed = list()
-        for case in cases:
-            if len(case) != self.inputs.nrbits: self.error("case with mismatch number of entries.")
-            inputs = dict((k, v) for k, v in zip(input_labels, list(case[i] for i in indexes)))
-            t = time.time()
-            self.set_input_values(inputs)
-            if not has_clock:
-                self.run()
-            else:
-                self.clock_next()
-            elapsed.append(time.time() - t)
-            if compact:
-                print(' ' + self.inputs.str(' ', order=input_labels) + ' | ' + self.outputs.str(' ', order=output_labels))
-            else:
-                print(' ' + self.inputs.str(', ', order=input_labels) + ' | ' + self.outputs.str(', ', order=output_labels))
-        print('-'*len_labels)
-        print(f'Mean elapsed time: {sum(elapsed)/len(elapsed)*1000:.2f} ms\n')
+        indexes = list(self.inputs.position(l) for l in input_labels)
+        self._report(self._case_batches(cases, input_labels, indexes, has_clock), \
+            input_labels, output_labels, compact, sink, quiet)
+    def results(self, cases, has_clock=False):
+        """
+        Yields, for each case of the iterable 'cases' (ordered as inputs.labels), the tuple of
+        output bits ordered as outputs.labels, evaluating lazily as test_set() does.
+        """
+        labels = self.inputs.labels
+        for words, lanes, _ in self._case_batches(cases, labels, list(range(len(labels))), has_clock):
+            for j in range(lanes):
+                yield tuple((words[l] >> j) & 1 for l in self.outputs.labels)
 
 
 class Circuit(Gate):
@@ -434,28 +1384,64 @@ class Circuit(Gate):
         super().__init__(name, 0, input_labels, output_labels)
         self.circuitry = dict()
         self.new_circuitry_entry(self)
+        self.schedule = None
+    def reset_schedule(self):
+        """
+        Forgets the cached running order; called by every structural change.
+        """
+        self.schedule = None
+        self._shape = None
+        self._thaw()
     def new_circuitry_entry(self, key):
-        self.circuitry[key] = { 'level': -1, 'same': [], 'children': [] }
-    def copy(self):
-        acopy = Circuit(self.name, self.inputs.labels, self.outputs.labels)
+        """
+        'same' and 'children' are dicts used as ordered sets (values unused): O(1) insertion,
+        lookup and removal, in a deterministic order.
+        """
+        self.circuitry[key] = { 'level': -1, 'same': dict(), 'children': dict() }
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self.__dict__.setdefault('schedule', None)
+        for v in self.__dict__.get('circuitry', dict()).values(): # lists in files saved before
+            v['same'], v['children'] = dict.fromkeys(v['same']), dict.fromkeys(v['children'])
+    def _build(self, source):
+        """
+        Components (flyweight copies of those of 'source'), connections and running order of
+        'source'; every component with a clock takes this one's.
+        """
+        wires = dict(zip(source._ports(), self._ports()))
+        if source.has_clock():
+            wires[source.clock] = self.clock
+        self.components, comp_dict = list(), {source: self}
+        for cp in source.components:
+            c = cp.copy()
+            self.components.append(c)
+            comp_dict[cp] = c
+            wires.update(zip(cp._ports(), c._ports()))
+        self.connections = dict((wires[k], set(wires[w] for w in v)) for k, v in source.connections.items())
+        self.inverted_outputs = None
+        self.__dict__.setdefault('visited', None)
+        self._switch = None
+        self.circuitry = dict()
+        for k, v in source.circuitry.items():
+            self.circuitry[comp_dict[k]] = { 'level': v['level'], 'same': dict.fromkeys(comp_dict[c] for c in v['same']),
+                'children': dict.fromkeys(comp_dict[c] for c in v['children']) }
+        schedule = getattr(source, 'schedule', None)
+        self.schedule = None if schedule is None else list(comp_dict[c] for c in schedule)
+        self._shape = None if schedule is None else getattr(source, '_shape', None)
+        self._replace_clock(self.clock)
+    def _digest(self, digests):
+        order = self.set_components_in_order_to_run()
+        if getattr(self, '_shape', None) is None:
+            wires = list(self.inputs[l] for l in self.inputs.labels) + list(self.outputs[l] for l in self.outputs.labels)
+            for c in order:
+                wires += list(c.inputs[l] for l in c.inputs.labels) + list(c.outputs[l] for l in c.outputs.labels)
+            self._shape = self._wiring(wires, (self.has_clock(), tuple(c.has_clock() for c in order)))
+        content = self._shape + self.store.values.translate(_FRESH) + ''.join(digests[id(c)] for c in order).encode()
         if self.has_clock():
-            acopy.clock = Wire()
-        for cp in self.components:
-            acopy.add_component(cp)
-        wires_dict = dict((ws, wc) for ws, wc in zip(self.get_wires(), acopy.get_wires()))
-        for k, v in self.connections.items():
-            acopy.connections[wires_dict[k]] = set(wires_dict[w] for w in v)
-        comp_dict = dict((cs, cc) for cs, cc in zip(self.components, acopy.components))
-        comp_dict.update({self: acopy})
-        for k, v in self.circuitry.items():
-            acopy.new_circuitry_entry(comp_dict[k])
-            acopy.circuitry[comp_dict[k]]['level'] = v['level']
-            acopy.circuitry[comp_dict[k]]['same'] = list(comp_dict[c] for c in v['same'])
-            acopy.circuitry[comp_dict[k]]['children'] = list(comp_dict[c] for c in v['children'])
-        acopy._replace_clock(acopy.clock)
-        return acopy
+            content += bytes([_FRESH[self.clock.store.values[self.clock.id]]])
+        return hashlib.sha1(content).hexdigest()
     def nrtransistors(self):
-        return sum(cp.nrtransistors() for cp in self.components)
+        return sum(cp.nrtransistors() for cp in self._source().components)
     def add_component(self, component):
         cp = component.copy()
         self.components.append(cp)
@@ -464,11 +1450,14 @@ class Circuit(Gate):
         for lbl in cp.outputs.labels:
             self.connections[cp[lbl]] = set()
         self.new_circuitry_entry(cp)
+        self.reset_schedule()
     def add_components(self, *argv):
         for arg in argv:
             qty = 1
             if type(arg) == tuple:
                 arg, qty = arg
+            if qty > 1: # copies of one flyweight copy share its definition
+                arg = arg.copy()
             for _ in range(qty):
                 self.add_component(arg)
     def connect_component_to(self, component_from, component_to, type_connection):
@@ -477,8 +1466,8 @@ class Circuit(Gate):
         """
         if not component_from in self.circuitry:
             self.error(f"{component_from} is not registered.")
-        if not component_to in self.circuitry[component_from][type_connection]:
-            self.circuitry[component_from][type_connection].append(component_to)
+        self.circuitry[component_from][type_connection][component_to] = None
+        self.reset_schedule()
     def connect(self, cidx_a, port_a, cidx_b, port_b):
         wire_a = self.components[cidx_a][port_a]
         wire_b = self.components[cidx_b][port_b]
@@ -493,35 +1482,51 @@ class Circuit(Gate):
             self.error(f"connection {self.components[cidx_a][port_a]} to {self.components[cidx_b][port_b]} not allowed (both outputs).")
     def reset_circuitry_levels(self):
         self.circuitry[self]['level'] = -1
+        self.reset_schedule()
     def is_circuitry_uninitialized(self):
         return any(c['level'] < 0 for c in self.circuitry.values())
     def prepare_circuitry_levels(self, key=None, level=0):
+        """
+        Depth-first leveling with an explicit stack: a 'same' component gets at least the level
+        of its peer, a child at least one more than its parent.
+        """
         if key is None:
             key = self
+        def edges(key, level):
+            for c in self.circuitry[key]['same']:
+                yield c, level
+            for c in self.circuitry[key]['children']:
+                yield c, level + 1
         self.circuitry[key]['level'] = level
-        for c in self.circuitry[key]['same']:
-            if c != self:
-                if self.circuitry[c]['level'] < level:
-                    self.prepare_circuitry_levels(key=c, level=level)
-        for c in self.circuitry[key]['children']:
-            if c != self:
-                if self.circuitry[c]['level'] <= level:
-                    self.prepare_circuitry_levels(key=c, level=level+1)
+        stack = [edges(key, level)]
+        while stack:
+            for c, lvl in stack[-1]:
+                if c != self and self.circuitry[c]['level'] < lvl:
+                    self.circuitry[c]['level'] = lvl
+                    stack.append(edges(c, lvl))
+                    break
+            else:
+                stack.pop()
     def set_components_in_order_to_run(self):
+        """
+        Running order of the components, computed from 'circuitry' on first use and then kept
+        in 'schedule' until a structural change (see reset_schedule).
+        """
+        schedule = getattr(self, 'schedule', None)
+        if not schedule is None:
+            return schedule
         for k, v in self.circuitry.items():
-            for c in v['children']:
+            for c in list(v['children']):
                 if k in self.circuitry[c]['children']:
-                    self.circuitry[c]['same'].append(k)
-                    self.circuitry[c]['children'].remove(k)
-                    self.circuitry[k]['same'].append(c)
-                    self.circuitry[k]['children'].remove(c)
+                    self.circuitry[c]['same'][k] = None
+                    del self.circuitry[c]['children'][k]
+                    self.circuitry[k]['same'][c] = None
+                    del self.circuitry[k]['children'][c]
         if self.is_circuitry_uninitialized():
             self.prepare_circuitry_levels()
-        raw = list((k, v['level']) for k, v in self.circuitry.items())
-        sort_raw = sorted(raw, key=lambda x:x[1])
-        ans = list(c[0] for c in sort_raw)
-        ans.remove(self)
-        return ans
+        raw = list((k, v['level']) for k, v in self.circuitry.items() if k is not self)
+        self.schedule = list(c[0] for c in sorted(raw, key=lambda x:x[1]))
+        return self.schedule
     def set_as_input(self, cidx, port, label):
         wire = self.components[cidx][port]
         self.connect_nodes_unidirecional(self.inputs[label], wire)
@@ -530,25 +1535,84 @@ class Circuit(Gate):
         wire = self.components[cidx][port]
         self.connect_nodes_unidirecional(wire, self.outputs[label])
         self.connect_component_to(self.components[cidx], self, 'children')
+    def set_as_inputs(self, cidx, ports, labels):
+        """
+        Bulk set_as_input: 'cidx' is a component index or a list of them, 'ports' and 'labels'
+        a label, a list of labels or a bus prefix ('a' stands for a15, ..., a0, in label order);
+        items are paired in order, single ones repeated:
+            ex. Inc16.set_as_inputs(0, 'a', 'inp'); Register.set_as_inputs(range(16), 'load', 'load')
+        """
+        cidxs = Circuit._indexes(cidx)
+        c = self.components[cidxs[0]]
+        for i, port, label in self._broadcast(cidxs, self._bus(ports, c.inputs), self._bus(labels, self.inputs)):
+            self.set_as_input(i, port, label)
+    def set_as_outputs(self, cidx, ports, labels):
+        """
+        Bulk set_as_output, arguments as in set_as_inputs().
+        """
+        cidxs = Circuit._indexes(cidx)
+        c = self.components[cidxs[0]]
+        for i, port, label in self._broadcast(cidxs, self._bus(ports, c.outputs), self._bus(labels, self.outputs)):
+            self.set_as_output(i, port, label)
+    def connect_buses(self, cidx_a, ports_a, cidx_b, ports_b):
+        """
+        Bulk connect, arguments as in set_as_inputs(); a prefix is looked up among the outputs of
+        the 'a' components first and among the inputs of the 'b' ones first:
+            ex. Ram.connect_buses(0, 'out', 9, 'a')
+        """
+        cidxs_a, cidxs_b = Circuit._indexes(cidx_a), Circuit._indexes(cidx_b)
+        a, b = self.components[cidxs_a[0]], self.components[cidxs_b[0]]
+        for i, port_a, j, port_b in self._broadcast(cidxs_a, self._bus(ports_a, a.outputs, a.inputs), \
+                cidxs_b, self._bus(ports_b, b.inputs, b.outputs)):
+            self.connect(i, port_a, j, port_b)
+    @staticmethod
+    def _indexes(cidx):
+        return [cidx] if type(cidx) == int else list(cidx)
+    def _bus(self, labels, *buses):
+        """
+        'labels' as a list: a single label of one of 'buses', the labels of a bus prefix there, in
+        order, or the given list.
+        """
+        if type(labels) != str:
+            return list(labels)
+        if any(labels in bus for bus in buses):
+            return [labels]
+        for bus in buses:
+            group = group_by_prefix(bus.labels).get(labels)
+            if not group is None:
+                return group
+        self.error(f"{labels} is neither a label nor a bus prefix.")
+    def _broadcast(self, *columns):
+        nritems = max(len(c) for c in columns)
+        if any(not len(c) in (1, nritems) for c in columns):
+            self.error(f"cannot pair {' with '.join(str(len(c)) for c in columns)} items.")
+        return zip(*(c*nritems if len(c) == 1 else c for c in columns))
     def set_high_input(self, cidx, port):
         wire = self.components[cidx][port]
         wire.set_high()
         wire.changeable = False
+        self._thaw()
     def set_low_input(self, cidx, port):
         wire = self.components[cidx][port]
         wire.set_low()
         wire.changeable = False
+        self._thaw()
     def _replace_clock(self, new_clock):
-        if self.has_clock():
-            if self.clock != new_clock:
-                self.change_node(self.clock, new_clock)
-                self.clock = new_clock
-            for c in self.components:
-                if c.has_clock():
-                    c._replace_clock(new_clock)
+        stack = [self]
+        while stack:
+            circuit = stack.pop()
+            if circuit.has_clock():
+                if '_definition' in circuit.__dict__:
+                    circuit.clock = new_clock # its components follow when it is built
+                    continue
+                if circuit.clock != new_clock:
+                    circuit.change_node(circuit.clock, new_clock)
+                    circuit.clock = new_clock
+                stack.extend(c for c in circuit.components if c.has_clock())
     def set_as_clock(self, cidx, port):
+        self.reset_schedule()
         if not self.has_clock():
-            self.clock = Wire(0, changeable=True, name='CLK')
+            self.clock = Wire(0, changeable=True, name='CLK', store=self.store)
             self.connections[self.clock] = set()
         if port == 'clock':
             self.components[cidx]._replace_clock(self.clock)
@@ -568,11 +1632,12 @@ class Circuit(Gate):
     #         if not c.clock is None:
     #             c.info_clocks()
     def _propagate_clock(self):
-        if self.has_clock():
-            self.propagate(self.clock)
-            for c in self.components:
-                if type(c) == Circuit:
-                    c._propagate_clock()
+        stack = [self]
+        while stack:
+            circuit = stack.pop()
+            if circuit.has_clock():
+                circuit.propagate(circuit.clock)
+                stack.extend(reversed(list(c for c in circuit.components if type(c) == Circuit)))
     def clock_next(self):
         self.clock.set_high()
         self._propagate_clock()
@@ -580,11 +1645,6 @@ class Circuit(Gate):
         self.clock.set_low()
         self._propagate_clock()
     def test_arithm(self, compact=True, label_display_order=None, msg = '', unsigned=[], has_clock=False, **kwargs):
-        def get_prefix(label):
-            for i in range(len(label)):
-                if label[i].isnumeric():
-                    return label[0:i]
-            return '' if label.isnumeric() else label
         input_labels, output_labels = self._labels_order(label_display_order)
         input_prefix = list()
         for lbl in input_labels:
@@ -598,7 +1658,7 @@ class Circuit(Gate):
                 inputs_dict[k]['labels'] = aux
                 inputs_dict[k]['value'] = v
                 inputs_dict[k]['nrbits'] = len(aux)
-                inputs_dict[k]['idbit'] = self.inputs.binvec.index(self.inputs[aux[0]])
+                inputs_dict[k]['idbit'] = self.inputs.position(aux[0])
                 inputs_dict[k]['signed'] = not k in unsigned
         user_input = ' received inputs (decimal): ' + ', '.join(list(f"{p}={inputs_dict[p]['value']}" for p in input_prefix))
         output_prefix = list()
@@ -612,7 +1672,7 @@ class Circuit(Gate):
             outputs_dict[p]['labels'] = aux
             outputs_dict[p]['value'] = None
             outputs_dict[p]['nrbits'] = len(aux)
-            outputs_dict[p]['idbit'] = self.outputs.binvec.index(self.outputs[aux[0]])
+            outputs_dict[p]['idbit'] = self.outputs.position(aux[0])
             outputs_dict[p]['signed'] = not p in unsigned
         len_labels = self._test_header(input_labels, output_labels, compact)
         inputs = dict()
@@ -643,3 +1703,1553 @@ class Circuit(Gate):
             ', '.join(list(f"{p}={outputs_dict[p]['value']}" for p in output_prefix)))
         print('-'*len_labels)
         print(f'Elapsed time: {elapsed*1000:.2f} ms\n')
+    def test_arithm_sweep(self, n, seed=None, reference=None, unsigned=[], batch=65536, show=20, **kwargs):
+        """
+        High-volume test_arithm: 'n' operand tuples, the corner cases of every input bus prefix
+        (0, 1, -1, lowest and highest value) first, then uniform random integers ('seed' for
+        numpy.random.default_rng), signed unless the prefix is in 'unsigned'; prefixes given as
+        keywords keep that value. Tuples are evaluated 'batch' at a time with run_arithm_batch()
+        and compared, modulo the bus width, with reference(**operands), which gets NumPy arrays
+        and returns the output bus value (or a dict, or a tuple in label order, for several).
+        Prints only the mismatches (the first 'show' of them), then the totals and samples per
+        second; returns dict(samples, mismatches, samples_per_s).
+        """
+        if np is None:
+            self.error("test_arithm_sweep needs NumPy.")
+        if reference is None:
+            self.error("test_arithm_sweep needs a reference.")
+        rng = np.random.default_rng(seed)
+        inputs, groups = group_by_prefix(self.inputs.labels), group_by_prefix(self.outputs.labels)
+        ranges = dict((p, (0, 2**len(l) - 1) if p in unsigned else (-2**(len(l) - 1), 2**(len(l) - 1) - 1)) \
+            for p, l in inputs.items() if not p in kwargs)
+        corners = list(itertools.islice(itertools.product(*(sorted(set(v for v in (0, 1, -1, lo, hi) if lo <= v <= hi)) \
+            for lo, hi in ranges.values())), n))
+        count, mismatches, elapsed = 0, 0, 0.0
+        while count < n:
+            size = min(batch, n - count)
+            operands = dict((p, rng.integers(lo, hi, size=size, endpoint=True, dtype=np.int64)) for p, (lo, hi) in ranges.items())
+            for j, corner in enumerate(corners[count:count + size]):
+                for p, v in zip(ranges, corner):
+                    operands[p][j] = v
+            operands.update((p, np.full(size, v, dtype=np.int64)) for p, v in kwargs.items())
+            t = time.perf_counter()
+            outputs = self.run_arithm_batch(unsigned=unsigned, **operands)
+            expected = reference(**operands)
+            if type(expected) != dict:
+                expected = dict(zip(groups, expected if type(expected) in [tuple, list] else [expected]))
+            wrong = np.zeros(size, dtype=bool)
+            for p, labels in groups.items():
+                nrbits = len(labels)
+                value = np.broadcast_to(np.asarray(expected[p], dtype=np.int64), (size,)) & (2**nrbits - 1)
+                if not p in unsigned:
+                    value = value - (((value >> (nrbits - 1)) & 1) << nrbits)
+                expected[p] = value
+                wrong |= value != outputs[p]
+            elapsed += time.perf_counter() - t
+            for j in np.flatnonzero(wrong):
+                if mismatches < show:
+                    print(' ' + ', '.join(f'{p}={operands[p][j]}' for p in operands) + ' | ' + \
+                        ', '.join(f'{p}={outputs[p][j]} (expected {expected[p][j]})' for p in groups))
+                mismatches += 1
+            count += size
+        rate = count / elapsed if elapsed > 0 else float('inf')
+        print(f'{self.header()} : {count} samples, {mismatches} mismatches, {rate:.0f} samples/s\n')
+        return dict(samples=count, mismatches=mismatches, samples_per_s=rate)
+
+
+class Netlist(Library):
+    """
+    Flat view of a component down to its leaf gates: every net is an integer indexing 'state',
+    'gates' holds (type, input nets, output nets) in evaluation order and 'types' holds, for each
+    leaf gate definition, (name, products, inverted outputs, number of transistors).
+    """
+    settle_limit = 64 # events per gate allowed in a single step in 'events' mode
+    format_version = 2 # of the binary files written by save()
+    _magic = b'ECSN'
+    _loaded = dict() # (name, digest) -> Netlist, definitions read by _reference()
+    _compiled = OrderedDict() # Gate.digest() -> Netlist, see flatten()
+    _generated = OrderedDict() # Gate.digest() (and undriven nets) -> module, see Gate.codegen()
+    _worker = None # Netlist evaluated by a process of Gate.sweep()
+    def __init__(self, name, input_labels, output_labels):
+        super().__init__(name)
+        self.input_labels = list(input_labels)
+        self.output_labels = list(output_labels)
+        self.inputs = list()
+        self.outputs = list()
+        self.clock = None
+        self.nrnets = 0
+        self.types = list()
+        self.gates = list()
+        self.consts = dict()
+        self.state = bytearray()
+        self.mode = 'levelized'
+        self.events = None
+        self._plan = None
+        self._cycles = None
+        self._fanout = None
+        self._active = None
+        self._children = None
+        self._references = None
+        self._pending = None
+        self._sources = None
+    @property
+    def gates(self):
+        if not self._pending is None:
+            self._expand()
+        return self._gates
+    @gates.setter
+    def gates(self, value):
+        self._gates = value
+    @property
+    def types(self):
+        if not self._pending is None:
+            self._expand()
+        return self._types
+    @types.setter
+    def types(self, value):
+        self._types = value
+    @classmethod
+    def flatten(cls, component, hierarchy=False, store=False):
+        """
+        hierarchy=True keeps, for every component, its own netlist and the map of its nets into
+        the parent's, so save() writes each definition once and refers to it by name and digest.
+        Otherwise components already flattened (same digest) are reused from the in-memory memo or
+        from Library.dirpath / 'cache'; store=True also writes the result there. The copy returned
+        takes its state from the current wire values of 'component'.
+        """
+        if hierarchy:
+            return cls._flatten(component, True, None)
+        digests = cls._digests(component)
+        net = cls._flatten(component, False, digests)
+        if store:
+            path = Library.dirpath / 'cache' / f'{digests[id(component)]}.net'
+            if not os.path.isfile(path):
+                os.makedirs(path.parent, exist_ok=True)
+                net.save(f'cache/{path.name}')
+        net = net.copy()
+        net._take_state(component)
+        return net
+    @classmethod
+    def _flatten(cls, component, hierarchy, digests):
+        if not digests is None:
+            net = cls._cached(digests[id(component)])
+            if not net is None:
+                return net
+            Library.counters['compile misses'] += 1
+            if component._unchanged():
+                component = component._source()
+        if isinstance(component, Circuit):
+            net = cls._flatten_circuit(component, hierarchy, digests)
+        else:
+            net = cls._flatten_gate(component)
+        if not digests is None:
+            Library._remember(cls._compiled, digests[id(component)], net)
+        return net
+    @classmethod
+    def _cached(cls, digest):
+        net = Library._recall(cls._compiled, digest)
+        if not net is None:
+            Library.counters['compile hits'] += 1
+        elif os.path.isfile(Library.dirpath / 'cache' / f'{digest}.net'):
+            net = cls._read(f'cache/{digest}.net')[0]
+            if net._sources is None: # written before the format kept them
+                return None
+            Library.counters['compile disk hits'] += 1
+            Library._remember(cls._compiled, digest, net)
+        return net
+    @classmethod
+    def _digests(cls, component):
+        """
+        digest of every component in the hierarchy, keyed by id(); children before parents.
+        """
+        digests, stack = dict(), [(component, False)]
+        while stack:
+            c, ready = stack.pop()
+            if id(c) in digests:
+                continue
+            if c._unchanged():
+                source = c._source()
+                if id(source) in digests:
+                    digests[id(c)] = digests[id(source)]
+                else:
+                    stack.extend([(c, True), (source, False)])
+                continue
+            if ready or not isinstance(c, Circuit):
+                digests[id(c)] = c._digest(digests)
+            else:
+                stack.append((c, True))
+                stack.extend((cp, False) for cp in c.components)
+        return digests
+    def copy(self):
+        """
+        Own state, constants and pending events; gate and type tables, and the plans compiled
+        from them (never changed in place), are shared. The engine (see set_mode) is kept.
+        """
+        acopy = Netlist(self.name, self.input_labels, self.output_labels)
+        acopy.inputs, acopy.outputs, acopy.clock = list(self.inputs), list(self.outputs), self.clock
+        acopy.nrnets, acopy.consts, acopy.state = self.nrnets, dict(self.consts), bytearray(self.state)
+        acopy.types, acopy.gates = self.types, self.gates
+        acopy._children, acopy._references, acopy._plan = self._children, self._references, self._plan
+        acopy._cycles, acopy._sources = self._cycles, self._sources
+        acopy.mode, acopy.events, acopy._fanout = self.mode, self.events, self._fanout
+        acopy._active = None if self._active is None else set(self._active)
+        return acopy
+    @classmethod
+    def _flatten_gate(cls, gate):
+        nin, nout = gate.inputs.nrbits, gate.outputs.nrbits
+        acopy = cls(gate.name, gate.inputs.labels, gate.outputs.labels)
+        acopy.nrnets = nin + nout
+        acopy.inputs = list(range(nin))
+        acopy.outputs = list(range(nin, nin + nout))
+        source = gate._source()
+        inverted = tuple(bool(source.inverted_outputs[source.outputs[l]]) for l in source.outputs.labels)
+        acopy.types.append((gate.name, source.switch_function(), inverted, source.nrtransistors()))
+        acopy.gates.append((0, tuple(acopy.inputs), tuple(acopy.outputs)))
+        wires = list(gate.inputs[l] for l in gate.inputs.labels) + list(gate.outputs[l] for l in gate.outputs.labels)
+        acopy.state = bytearray(1 if w.next else 0 for w in wires)
+        acopy._sources = list(((), n) for n in range(len(wires)))
+        for n, w in enumerate(wires):
+            if not w.changeable:
+                acopy.consts[n] = acopy.state[n]
+        return acopy
+    @classmethod
+    def _flatten_circuit(cls, circuit, hierarchy, digests):
+        order = circuit.set_components_in_order_to_run()
+        subs = list(cls._flatten(c, hierarchy, digests) for c in order)
+        parent, node = list(), dict()
+        def find(n):
+            while parent[n] != n:
+                parent[n] = parent[parent[n]]
+                n = parent[n]
+            return n
+        def union(a, b):
+            ra, rb = find(a), find(b)
+            if ra != rb: parent[ra] = rb
+        def new():
+            parent.append(len(parent))
+            return parent[-1]
+        def bind(wire, n):
+            if wire in node: union(node[wire], n)
+            else: node[wire] = n
+        own = list(circuit.inputs[l] for l in circuit.inputs.labels) + \
+            list(circuit.outputs[l] for l in circuit.outputs.labels)
+        if circuit.has_clock():
+            own.append(circuit.clock)
+        for w in own:
+            bind(w, new())
+        offsets = list()
+        for c, sub in zip(order, subs):
+            offset = len(parent)
+            offsets.append(offset)
+            parent.extend(range(offset, offset + sub.nrnets))
+            for l, n in zip(sub.input_labels, sub.inputs):
+                bind(c.inputs[l], offset + n)
+            for l, n in zip(sub.output_labels, sub.outputs):
+                bind(c.outputs[l], offset + n)
+            if not sub.clock is None:
+                bind(c.clock, offset + sub.clock)
+        for k, v in circuit.connections.items():
+            for w in v:
+                if not k in node: bind(k, new())
+                if not w in node: bind(w, new())
+                union(node[k], node[w])
+        ids = dict()
+        def net(n):
+            return ids.setdefault(find(n), len(ids))
+        acopy = cls(circuit.name, circuit.inputs.labels, circuit.outputs.labels)
+        acopy.inputs = list(net(node[circuit.inputs[l]]) for l in circuit.inputs.labels)
+        acopy.outputs = list(net(node[circuit.outputs[l]]) for l in circuit.outputs.labels)
+        if circuit.has_clock():
+            acopy.clock = net(node[circuit.clock])
+        netmaps = list(tuple(net(offset + n) for n in range(sub.nrnets)) for offset, sub in zip(offsets, subs))
+        acopy._link(subs, netmaps)
+        if hierarchy:
+            acopy._children = list(zip(subs, netmaps))
+        acopy.nrnets = len(ids)
+        values, sources = [None]*acopy.nrnets, [None]*acopy.nrnets
+        for k, (netmap, sub) in enumerate(zip(netmaps, subs)):
+            driven = sub.driven()
+            for n in range(sub.nrnets):
+                i = netmap[n]
+                if n in driven or values[i] is None:
+                    values[i] = sub.state[n]
+                    source = sub._sources[n]
+                    sources[i] = None if source is None else ((k,) + source[0], source[1])
+            for n, v in sub.consts.items():
+                acopy.consts[netmap[n]] = v
+        position = dict((w, p) for p, w in enumerate(own))
+        for w, n in node.items():
+            i = ids.get(find(n))
+            if i is None: continue
+            if values[i] is None:
+                values[i] = 1 if w.next else 0
+                sources[i] = ((), position[w]) if w in position else None
+            if not w.changeable:
+                acopy.consts[i] = 1 if w.next else 0
+        for i, v in acopy.consts.items():
+            values[i] = v
+        acopy.state = bytearray(0 if v is None else v for v in values)
+        acopy._sources = sources
+        return acopy
+    def _take_state(self, component):
+        """
+        Current wire values of 'component' (of the digest this netlist was flattened from) into
+        'state': '_sources' gives, per net, the wire its value came from as (path of running-order
+        indexes down the hierarchy, position among inputs, outputs and clock); constants are kept.
+        """
+        found, wires = dict(), dict()
+        def resolve(path):
+            c = found.get(path)
+            if c is None:
+                c = component if not path else resolve(path[:-1]).set_components_in_order_to_run()[path[-1]]
+                if c._unchanged(): # flattened from its definition, see _flatten()
+                    c = c._source()
+                found[path] = c
+            return c
+        for i, source in enumerate(self._sources):
+            if source is None: continue
+            path, pos = source
+            ws = wires.get(path)
+            if ws is None:
+                c = resolve(path)
+                ws = wires[path] = list(c.inputs[l] for l in c.inputs.labels) + list(c.outputs[l] for l in c.outputs.labels) + \
+                    ([c.clock] if isinstance(c, Circuit) and c.has_clock() else [])
+            self.state[i] = 1 if ws[pos].next else 0
+        for i, v in self.consts.items():
+            self.state[i] = v
+    def _link(self, subs, netmaps):
+        """
+        Gate and type tables out of the components' netlists, in running order, with their nets
+        renamed through 'netmaps' (one tuple per component: its net -> net here).
+        """
+        type_index, gates = dict(), list()
+        for sub, netmap in zip(subs, netmaps):
+            tmap = list(type_index.setdefault(t, len(type_index)) for t in sub.types)
+            for t, ins, outs in sub.gates:
+                gates.append((tmap[t], tuple(netmap[n] for n in ins), tuple(netmap[n] for n in outs)))
+        self.types = list(type_index.keys())
+        self.gates = gates
+    def _expand(self):
+        references, self._pending = self._pending, None
+        subs = list(Netlist._reference(name, digest) for name, digest, _ in references)
+        self._link(subs, list(netmap for _, _, netmap in references))
+    @classmethod
+    def _reference(cls, name, digest):
+        """
+        Definition 'name' with the given digest, read once per process: from name.net or, when that
+        file holds another definition, from name.<digest>.net (see save()).
+        """
+        key = (name, digest)
+        if not key in cls._loaded:
+            for filename in [f'{name}.net', f'{name}.{digest[:12]}.net']:
+                if os.path.isfile(Library.dirpath / filename):
+                    net, found = cls._read(filename)
+                    if found == digest:
+                        cls._loaded[key] = net
+                        break
+            else:
+                raise Exception(f"{name}.net: no definition with digest {digest[:12]}, save it again.")
+        return cls._loaded[key]
+    def save(self, filename=None):
+        """
+        Writes the versioned binary format (.net) and returns its digest. Netlists from
+        flatten(component, hierarchy=True) keep only their own nets and one reference (name,
+        digest) per component, whose definitions are written next to it when missing.
+        """
+        if filename is None:
+            filename = self.name + '.net'
+        data = self._encode(dict())
+        with open(Library.dirpath / filename, 'wb') as f:
+            f.write(data)
+        return hashlib.sha1(data).hexdigest()
+    def _store(self, written):
+        """
+        Writes this definition for a parent to refer to: as name.net if that file is free or
+        already holds it, as name.<digest>.net otherwise; 'written' maps digests already handled.
+        """
+        data = self._encode(written)
+        digest = hashlib.sha1(data).hexdigest()
+        if not digest in written:
+            path = Library.dirpath / f'{self.name}.net'
+            if os.path.isfile(path) and Netlist._read(path.name)[1] != digest:
+                path = Library.dirpath / f'{self.name}.{digest[:12]}.net'
+            if not os.path.isfile(path):
+                with open(path, 'wb') as f:
+                    f.write(data)
+            written[digest] = path.name
+        return digest
+    def _encode(self, written):
+        """
+        Little-endian layout: magic, version, kind (0 flat, 1 hierarchical), name and labels,
+        nets (count, clock, inputs, outputs, constants, state), then either the type table, the
+        gates as [type, #in, #out, in..., out...] and (version 2) the sources of the state as
+        [0] or [depth + 1, path..., position] per net (none if empty, see _take_state()) or, per
+        component, name, digest and net map.
+        """
+        data = bytearray(struct.pack('<4sHB', Netlist._magic, Netlist.format_version,
+            0 if self._children is None and self._references is None else 1))
+        def text(s):
+            b = s.encode()
+            data.extend(struct.pack('<H', len(b)) + b)
+        def words(values):
+            a = array('I', values)
+            if sys.byteorder == 'big': a.byteswap()
+            data.extend(struct.pack('<I', len(a)) + a.tobytes())
+        text(self.name)
+        for labels in [self.input_labels, self.output_labels]:
+            data.extend(struct.pack('<I', len(labels)))
+            for l in labels: text(l)
+        data.extend(struct.pack('<Ii', self.nrnets, -1 if self.clock is None else self.clock))
+        words(self.inputs)
+        words(self.outputs)
+        words(self.consts.keys())
+        data.extend(bytes(self.consts.values()))
+        data.extend(bytes(self.state))
+        if data[6] == 0:
+            data.extend(struct.pack('<I', len(self.types)))
+            for name, products, inverted, nrtransistors in self.types:
+                text(name)
+                data.extend(struct.pack('<IH', nrtransistors, len(inverted)) + bytes(inverted))
+                data.extend(struct.pack('<H', len(products)))
+                for p in products:
+                    data.extend(struct.pack(f'<H{len(p)}H', len(p), *p))
+            words(v for t, ins, outs in self.gates for v in (t, len(ins), len(outs)) + ins + outs)
+            words(v for source in self._sources or () for v in
+                ((0,) if source is None else (len(source[0]) + 1,) + source[0] + (source[1],)))
+        else:
+            references = self._references if self._children is None else \
+                list((sub.name, sub._store(written), netmap) for sub, netmap in self._children)
+            data.extend(struct.pack('<I', len(references)))
+            for name, digest, netmap in references:
+                text(name)
+                data.extend(bytes.fromhex(digest))
+                words(netmap)
+        return bytes(data)
+    @classmethod
+    def load(cls, filename):
+        """
+        Reads a .net file (memory-mapped) into a runnable Netlist; components of a hierarchical
+        one are only read when its gates are first needed.
+        """
+        if not filename.endswith('.net'):
+            filename += '.net'
+        return cls._read(filename)[0]
+    @classmethod
+    def _read(cls, filename):
+        with open(Library.dirpath / filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            digest = hashlib.sha1(m).hexdigest()
+            magic, version, kind = struct.unpack_from('<4sHB', m)
+            if magic != cls._magic:
+                raise Exception(f"{filename}: not a netlist file.")
+            if version > cls.format_version:
+                raise Exception(f"{filename}: format version {version}, this simulator reads up to {cls.format_version}.")
+            pos = struct.calcsize('<4sHB')
+            def take(fmt):
+                nonlocal pos
+                values = struct.unpack_from(fmt, m, pos)
+                pos += struct.calcsize(fmt)
+                return values
+            def text():
+                nonlocal pos
+                size, = take('<H')
+                pos += size
+                return m[pos - size:pos].decode()
+            def words():
+                nonlocal pos
+                size, = take('<I')
+                a = array('I')
+                a.frombytes(m[pos:pos + 4*size])
+                if sys.byteorder == 'big': a.byteswap()
+                pos += 4*size
+                return a
+            def raw(size):
+                nonlocal pos
+                pos += size
+                return m[pos - size:pos]
+            name = text()
+            labels = list(list(text() for _ in range(take('<I')[0])) for _ in range(2))
+            net = cls(name, *labels)
+            net.nrnets, clock = take('<Ii')
+            net.clock = None if clock < 0 else clock
+            net.inputs, net.outputs = list(words()), list(words())
+            keys = words()
+            net.consts = dict(zip(keys, raw(len(keys))))
+            net.state = bytearray(raw(net.nrnets))
+            if kind == 0:
+                types = list()
+                for _ in range(take('<I')[0]):
+                    tname = text()
+                    nrtransistors, size = take('<IH')
+                    inverted = tuple(bool(v) for v in raw(size))
+                    products = tuple(take(f'<{take("<H")[0]}H') for _ in range(take('<H')[0]))
+                    types.append((tname, products, inverted, nrtransistors))
+                flat, gates, i = words(), list(), 0
+                while i < len(flat):
+                    nin, nout = flat[i + 1], flat[i + 2]
+                    j = i + 3 + nin
+                    gates.append((flat[i], tuple(flat[i + 3:j]), tuple(flat[j:j + nout])))
+                    i = j + nout
+                net.types, net.gates = types, gates
+                flat, sources, i = words() if version >= 2 else (), list(), 0
+                while i < len(flat):
+                    depth = flat[i] - 1
+                    sources.append(None if depth < 0 else (tuple(flat[i + 1:i + 1 + depth]), flat[i + 1 + depth]))
+                    i += 2 + depth if depth >= 0 else 1
+                net._sources = sources if sources else None
+            else:
+                net._references = list((text(), raw(20).hex(), tuple(words())) for _ in range(take('<I')[0]))
+                net._pending = net._references
+        return net, digest
+    def driven(self):
+        return set(n for _, _, outs in self.gates for n in outs)
+    def nrgates(self):
+        return len(self.gates)
+    def nrtransistors(self):
+        return sum(self.types[t][3] for t, _, _ in self.gates)
+    def header(self):
+        return f"{self} : I/O {len(self.inputs)}⨉{len(self.outputs)} [#G {self.nrgates()}, #Q {self.nrtransistors()}, #N {self.nrnets}]"
+    def info(self):
+        print(self.header())
+        print('Inputs (in order) :', self.input_labels)
+        print('Outputs (in order):', self.output_labels)
+    def optimize(self):
+        """
+        Simplifies the gates in place, results staying bit-identical in both modes: constant nets
+        (pinned, or never written) are folded through the gates, gates computing the same function
+        of the same nets are merged and gates whose outputs reach no output are removed. A gate
+        only becomes a constant, or is merged into an earlier one, when every reader of its
+        outputs comes after it (no feedback), so nothing reads a value it would not have written.
+        Nets folded to a constant get that value in 'consts' and 'state'; nets of merged or dead
+        gates are no longer computed. Returns the number of gates removed by each step and the
+        transistors they held.
+        """
+        fixed, outputs = set(self.inputs) - set(self.consts), set(self.outputs)
+        if not self.clock is None:
+            fixed.add(self.clock)
+        removed = dict(constant=0, merged=0, dead=0, transistors=0)
+        def minimal(prods):
+            prods = set(prods)
+            return list(p for p in prods if not any(q < p for q in prods))
+        def drivers_readers(entries):
+            drivers, last, first = dict(), dict(), dict()
+            for g, (_, prods, _, outs, _) in enumerate(entries):
+                for n in outs:
+                    if not n in self.consts:
+                        drivers[n], last[n] = drivers.get(n, 0) + 1, g
+                for n in set().union(*prods):
+                    first.setdefault(n, g)
+            return drivers, last, first
+        entries = list()
+        for t, ins, outs in self.gates:
+            name, products, inverted, size = self.types[t]
+            entries.append((name, list(frozenset(ins[i] for i in p) for p in products), inverted, outs, size))
+        # constant folding
+        drivers, _, first = drivers_readers(entries)
+        known = dict((n, self.consts.get(n, self.state[n])) for n in range(self.nrnets) if not n in drivers and not n in fixed)
+        folded = list()
+        for g, (name, prods, inverted, outs, size) in enumerate(entries):
+            prods = minimal(frozenset(n for n in p if not n in known) for p in prods if not any(known.get(n) == 0 for n in p))
+            written = list((n, inv) for n, inv in zip(outs, inverted) if not n in self.consts)
+            if len(prods) == 0 or frozenset() in prods:
+                prods = [] if len(prods) == 0 else [frozenset()]
+                short = len(prods) > 0
+                if all(drivers[n] == 1 and first.get(n, g + 1) > g and not n in fixed and \
+                        (not n in outputs or self.state[n] == (short != inv)) for n, inv in written):
+                    for n, inv in written:
+                        known[n] = self.consts[n] = self.state[n] = int(short != inv)
+                    removed['constant'] += 1
+                    removed['transistors'] += size
+                    continue
+            folded.append((name, prods, inverted, outs, size))
+        # merging of equivalent gates
+        drivers, last, first = drivers_readers(folded)
+        def mergeable(i, j, nets):
+            outs_i, outs_j = folded[i][3], folded[j][3]
+            return all(last.get(n, -1) < i for n in nets) and \
+                all(not n in self.consts and drivers[n] == 1 for n in outs_i + outs_j) and \
+                all(first.get(m, j + 1) > j and not m in fixed and (not m in outputs or self.state[m] == self.state[n]) \
+                    for m, n in zip(outs_j, outs_i))
+        rename, seen, merged = dict(), dict(), list()
+        for j, (name, prods, inverted, outs, size) in enumerate(folded):
+            prods = list(frozenset(rename.get(n, n) for n in p) for p in prods)
+            key = (frozenset(prods), inverted)
+            i = seen.get(key)
+            if not i is None and mergeable(i, j, set().union(*prods)):
+                rename.update(zip(outs, folded[i][3]))
+                removed['merged'] += 1
+                removed['transistors'] += size
+                continue
+            seen[key] = j
+            merged.append((name, prods, inverted, outs, size))
+        self.outputs = list(rename.get(n, n) for n in self.outputs)
+        # dead logic
+        drivers = dict()
+        for g, (_, _, _, outs, _) in enumerate(merged):
+            for n in outs:
+                if not n in self.consts:
+                    drivers.setdefault(n, list()).append(g)
+        live, keep, stack = set(self.outputs), [False]*len(merged), list(set(self.outputs))
+        while stack:
+            for g in drivers.get(stack.pop(), []):
+                if not keep[g]:
+                    keep[g] = True
+                    for n in set().union(*merged[g][1]) - live:
+                        live.add(n)
+                        stack.append(n)
+        types, type_index, gates = list(), dict(), list()
+        for (name, prods, inverted, outs, size), alive in zip(merged, keep):
+            if not alive:
+                removed['dead'] += 1
+                removed['transistors'] += size
+                continue
+            ins = tuple(sorted(set().union(*prods)))
+            position = dict((n, i) for i, n in enumerate(ins))
+            key = (name, tuple(sorted(tuple(sorted(position[n] for n in p)) for p in prods)), inverted, size)
+            if not key in type_index:
+                type_index[key] = len(types)
+                types.append(key)
+            gates.append((type_index[key], ins, tuple(outs)))
+        self.types, self.gates = types, gates
+        self._children, self._references = None, None
+        self._plan, self._cycles, self._fanout, self._active = None, None, None, None
+        return removed
+    def _compile_plan(self):
+        plan = list()
+        for t, ins, outs in self.gates:
+            _, products, inverted, _ = self.types[t]
+            prods = tuple(tuple(ins[i] for i in p) for p in products)
+            plan.append((prods, tuple((n, inv) for n, inv in zip(outs, inverted) if not n in self.consts)))
+        self._plan = plan
+        return plan
+    def set_mode(self, mode):
+        """
+        'levelized': every step is one pass over all gates in evaluation order;
+        'events': every step evaluates only gates with a changed input (in evaluation order),
+        until no net changes; 'events' then holds the number of gate evaluations of the last step.
+        """
+        if not mode in ['levelized', 'events']:
+            self.error(f"unknown mode {mode}.")
+        self.mode = mode
+        self._active = None
+    def _compile_fanout(self):
+        fanout = list(list() for _ in range(self.nrnets))
+        for g, (_, ins, _) in enumerate(self.gates):
+            for n in set(ins):
+                fanout[n].append(g)
+        self._fanout = list(tuple(f) for f in fanout)
+        return self._fanout
+    def _write(self, n, v):
+        if self.state[n] != v:
+            self.state[n] = v
+            if not self._active is None:
+                self._active.add(n)
+    def evaluate(self):
+        if self.mode == 'events':
+            self._evaluate_events()
+        else:
+            self._evaluate_levelized()
+    def _evaluate_events(self):
+        """
+        Activity queue ordered by evaluation order, fed through the net fan-out index; the first
+        step after compiling (or switching modes) evaluates every gate.
+        """
+        plan = self._plan if not self._plan is None else self._compile_plan()
+        fanout = self._fanout if not self._fanout is None else self._compile_fanout()
+        state = self.state
+        if self._active is None:
+            queue = list(range(len(plan)))
+        else:
+            queue = sorted(set(g for n in self._active for g in fanout[n]))
+        queued = set(queue)
+        events, limit = 0, Netlist.settle_limit * max(1, len(plan))
+        while queue:
+            g = heapq.heappop(queue)
+            queued.discard(g)
+            events += 1
+            if events > limit:
+                self.error(f"no steady state after {limit} events, check for oscillating feedback.")
+            prods, outs = plan[g]
+            short = False
+            for p in prods:
+                for n in p:
+                    if not state[n]: break
+                else:
+                    short = True
+                    break
+            for n, inv in outs:
+                v = short != inv
+                if state[n] != v:
+                    state[n] = v
+                    for h in fanout[n]:
+                        if not h in queued:
+                            queued.add(h)
+                            heapq.heappush(queue, h)
+        self._active = set()
+        self.events = events
+    def _evaluate_levelized(self):
+        """
+        One pass over the gates in evaluation order, reading and writing 'state' in place.
+        """
+        plan = self._plan if not self._plan is None else self._compile_plan()
+        state = self.state
+        for prods, outs in plan:
+            short = False
+            for p in prods:
+                for n in p:
+                    if not state[n]: break
+                else:
+                    short = True
+                    break
+            for n, inv in outs:
+                state[n] = short != inv
+    def set_input_values(self, values):
+        if type(values) == list and len(values) == len(self.inputs):
+            pairs = zip(self.inputs, values)
+        elif type(values) == dict:
+            index = dict(zip(self.input_labels, self.inputs))
+            pairs = list((index[k], v) for k, v in values.items())
+        else:
+            self.error(f"wrong number of values, expecting {len(self.inputs)}, not {len(values)}.")
+        for n, v in pairs:
+            if not n in self.consts:
+                self._write(n, 0 if v == 0 else 1)
+    def get_output_values(self):
+        return list(self.state[n] for n in self.outputs)
+    def is_combinational(self):
+        """
+        True when every gate reads only nets already settled in the same pass (inputs, constants,
+        undriven nets or outputs of earlier gates), so a pass does not depend on previous state.
+        """
+        driven, settled = self.driven(), set()
+        for _, ins, outs in self.gates:
+            if any(n in driven and not n in settled for n in ins):
+                return False
+            settled.update(outs)
+        return True
+    def run_batch(self, inputs):
+        """
+        Vectorized pass over an (N, inputs) array of bits, ordered as input_labels; returns the
+        (N, outputs) array, ordered as output_labels. Rows are packed 64 per uint64 word, so each
+        gate costs a few NumPy operations over N/64 words. Like run_words(), state is not changed.
+        """
+        if np is None:
+            self.error("run_batch needs NumPy.")
+        bits = np.asarray(inputs)
+        if bits.ndim != 2 or bits.shape[1] != len(self.inputs):
+            self.error(f"expecting an (N, {len(self.inputs)}) array, not {bits.shape}.")
+        plan = self._plan if not self._plan is None else self._compile_plan()
+        nrows = bits.shape[0]
+        nrwords = (nrows + 63) // 64
+        packed = np.zeros((len(self.inputs), nrwords * 8), dtype=np.uint8)
+        packed[:, :(nrows + 7) // 8] = np.packbits(bits != 0, axis=0, bitorder='little').T
+        words = packed.view(np.uint64)
+        zero, ones = np.uint64(0), ~np.uint64(0)
+        vals = list(ones if v else zero for v in self.state)
+        for i, n in enumerate(self.inputs):
+            if not n in self.consts:
+                vals[n] = words[i]
+        for prods, outs in plan:
+            short = zero
+            for p in prods:
+                w = ones
+                for n in p:
+                    w = w & vals[n]
+                short = short | w
+            for n, inv in outs:
+                vals[n] = ~short if inv else short
+        results = np.empty((len(self.outputs), nrwords), dtype=np.uint64)
+        for i, n in enumerate(self.outputs):
+            results[i] = vals[n]
+        results = np.unpackbits(results.view(np.uint8), axis=1, count=nrows, bitorder='little').T
+        return np.ascontiguousarray(results, dtype=bool if bits.dtype == bool else np.uint8)
+    def run_words(self, words, nrvectors):
+        """
+        Bitsliced pass: 'words' holds one int per input (bit j is its value in vector j), so a single
+        pass evaluates 'nrvectors' input vectors at once; returns one int per output, same layout.
+        State is not changed, hence results are only meaningful when is_combinational().
+        """
+        plan = self._plan if not self._plan is None else self._compile_plan()
+        mask = (1 << nrvectors) - 1
+        vals = list(mask if v else 0 for v in self.state)
+        for n, w in zip(self.inputs, words):
+            if not n in self.consts:
+                vals[n] = w & mask
+        for prods, outs in plan:
+            short = 0
+            for p in prods:
+                w = mask
+                for n in p:
+                    w &= vals[n]
+                short |= w
+            for n, inv in outs:
+                vals[n] = short ^ mask if inv else short
+        return list(vals[n] for n in self.outputs)
+    def symbolic(self, bdd, inputs):
+        """
+        BDD (see BDD) of every output, ordered as output_labels, given the BDD of every input in
+        'inputs' (ordered as input_labels); as run_words(), for combinational netlists.
+        """
+        if not self.is_combinational():
+            self.error("symbolic evaluation needs a combinational netlist.")
+        plan = self._plan if not self._plan is None else self._compile_plan()
+        vals = list(1 if v else 0 for v in self.state)
+        for n, f in zip(self.inputs, inputs):
+            if not n in self.consts:
+                vals[n] = f
+        for prods, outs in plan:
+            short = 0
+            for p in prods:
+                f = 1
+                for n in p:
+                    f = bdd.apply('and', f, vals[n])
+                short = bdd.apply('or', short, f)
+            for n, inv in outs:
+                vals[n] = bdd.apply('xor', short, 1) if inv else short
+        return list(vals[n] for n in self.outputs)
+    def faults(self):
+        """
+        Stuck-at faults as (net, value) pairs: both values on every input and gate output net
+        that is not a constant, in net order.
+        """
+        nets = sorted((set(self.inputs) | self.driven()) - set(self.consts))
+        return list((n, v) for n in nets for v in (0, 1))
+    def _fault_name(self, fault):
+        n, v = fault
+        for labels, nets in [(self.input_labels, self.inputs), (self.output_labels, self.outputs)]:
+            if n in nets:
+                return f'{labels[nets.index(n)]}/{v}'
+        return f'n{n}/{v}'
+    def fault_simulate(self, vectors, faults=None, drop=True, lanes=None):
+        """
+        Parallel stuck-at fault simulation of a combinational netlist: each vector of 'vectors'
+        (bits ordered as input_labels) is evaluated for up to lanes-1 faulty machines per pass
+        (default Gate.bitslice_lanes), one per bit, next to the good one in the last bit; a fault
+        is detected when an output differs. With drop=True, detected faults are not simulated
+        again and vectors are consumed only until every fault is detected. Returns the number of
+        faults (default faults()) and of detected ones, the coverage, the undetected faults and,
+        per vector, the faults it detects (first, with drop=True), named 'label/value' or 'n<net>/value'.
+        """
+        if not self.is_combinational():
+            self.error("fault simulation needs a combinational netlist.")
+        faults = self.faults() if faults is None else list(faults)
+        width = (Gate.bitslice_lanes if lanes is None else lanes) - 1
+        detected, remaining, detections = set(), faults, list()
+        for vector in vectors:
+            if drop and len(remaining) == 0:
+                break
+            if len(vector) != len(self.inputs):
+                self.error(f"wrong number of values, expecting {len(self.inputs)}, not {len(vector)}.")
+            pending, found = remaining if drop else faults, list()
+            for start in range(0, len(pending), width):
+                group = pending[start:start + width]
+                k = len(group)
+                mask = (1 << (k + 1)) - 1
+                force = dict()
+                for j, (n, v) in enumerate(group):
+                    keep, high = force.get(n, (mask, 0))
+                    force[n] = (keep & ~(1 << j), high | (v << j))
+                diff = 0
+                for w in self._run_forced(list(mask if b else 0 for b in vector), mask, force):
+                    diff |= w ^ (mask if w >> k & 1 else 0)
+                found.extend(group[j] for j in range(k) if diff >> j & 1)
+            detections.append(list(self._fault_name(f) for f in found))
+            detected.update(found)
+            if drop and len(found) > 0:
+                remaining = list(f for f in remaining if not f in detected)
+        return dict(faults=len(faults), detected=len(detected), coverage=len(detected) / max(len(faults), 1),
+            undetected=list(self._fault_name(f) for f in faults if not f in detected), detections=detections)
+    def _run_forced(self, words, mask, force):
+        """
+        run_words() pass over the bits in 'mask' with every net n in 'force' set, after it is
+        computed, to (value & keep) | high, where force[n] = (keep, high).
+        """
+        plan = self._plan if not self._plan is None else self._compile_plan()
+        vals = list(mask if v else 0 for v in self.state)
+        for n, w in zip(self.inputs, words):
+            if not n in self.consts:
+                vals[n] = w
+        for n, (keep, high) in force.items():
+            vals[n] = (vals[n] & keep) | high
+        for prods, outs in plan:
+            short = 0
+            for p in prods:
+                w = mask
+                for n in p:
+                    w &= vals[n]
+                short |= w
+            for n, inv in outs:
+                v = short ^ mask if inv else short
+                f = force.get(n)
+                vals[n] = v if f is None else (v & f[0]) | f[1]
+        return list(vals[n] for n in self.outputs)
+    def sweep_range(self, start, stop, order=None, reference=None):
+        """
+        Evaluates the input vectors numbered start, ..., stop-1, each number read in binary over
+        the labels in 'order' (default input_labels), most significant first; inputs left out keep
+        their value. Returns one int per output, bit j being its value for vector start+j, or,
+        given 'reference' (a callable from vector number to the expected outputs, read as a number
+        over output_labels, most significant first), the pair (number of mismatching vectors,
+        first mismatching vector or None).
+        """
+        order = self.input_labels if order is None else order
+        dimension, nrout = len(order), len(self.outputs)
+        lanes = min(2**dimension, Gate.bitslice_lanes)
+        mask = (1 << lanes) - 1
+        position = dict((l, i) for i, l in enumerate(self.input_labels))
+        fixed = list(mask if self.state[n] else 0 for n in self.inputs)
+        results, count, first = [0]*nrout, 0, None
+        base = start - start % lanes
+        while base < stop:
+            words = list(fixed)
+            for i, l in enumerate(order):
+                words[position[l]] = Gate._counter_word(dimension - 1 - i, base, lanes)
+            lo, hi = max(start, base), min(stop, base + lanes)
+            keep = (1 << (hi - lo)) - 1
+            outputs = list((w >> (lo - base)) & keep for w in self.run_words(words, lanes))
+            if reference is None:
+                for k, w in enumerate(outputs):
+                    results[k] |= w << (lo - start)
+            else:
+                expected = list(reference(v) for v in reversed(range(lo, hi)))
+                diff = 0
+                for k, w in enumerate(outputs):
+                    bit = nrout - 1 - k
+                    diff |= w ^ int(''.join('1' if e >> bit & 1 else '0' for e in expected), 2)
+                if diff:
+                    if first is None:
+                        first = lo + (diff & -diff).bit_length() - 1
+                    count += bin(diff).count('1')
+            base += lanes
+        return results if reference is None else (count, first)
+    @staticmethod
+    def _sweep_init(dirpath, filename, state):
+        Library.dirpath = dirpath
+        Netlist._worker = Netlist.load(filename)
+        Netlist._worker.restore(state)
+    @staticmethod
+    def _sweep_task(start, stop, order, reference):
+        return Netlist._worker.sweep_range(start, stop, order, reference)
+    def run(self, inputs=None):
+        if not inputs is None:
+            self.set_input_values(inputs)
+        self.evaluate()
+        return self.get_output_values()
+    def clock_next(self, inputs=None):
+        if self.clock is None:
+            self.error("there is no clock to tick.")
+        if not inputs is None:
+            self.set_input_values(inputs)
+        self._write(self.clock, 1)
+        self.evaluate()
+        self._write(self.clock, 0)
+        return self.get_output_values()
+    @staticmethod
+    def _sop(prods, known):
+        """
+        Python expression of the sum of products 'prods' (tuples of nets, read from locals n<net>),
+        nets in 'known' replaced by their value; 0 or 1 when that makes the sum constant.
+        """
+        terms = list()
+        for p in prods:
+            if any(known.get(n) == 0 for n in p):
+                continue
+            factors = list(f'n{n}' for n in p if not n in known)
+            if len(factors) == 0:
+                return 1
+            terms.append(' & '.join(factors))
+        if len(terms) == 0:
+            return 0
+        return ' | '.join(f'({t})' if ' & ' in t and len(terms) > 1 else t for t in terms)
+    def _compile_cycles(self, watch=()):
+        """
+        Generates the straight-line Python of run_cycles() and fork(): one local per net and one
+        bitwise expression per gate in evaluation order, with the clock (high while evaluating, as
+        in clock_next()), constants and nets already set to a constant in the pass folded in;
+        'm' is the value of a high net, 1 or, bitsliced, a mask of ones. Samples hold the outputs,
+        then the nets in 'watch'; only the function without them is kept in '_cycles'.
+        """
+        plan = self._plan if not self._plan is None else self._compile_plan()
+        driven, fixed = self.driven(), set(self.inputs) | {self.clock}
+        known = dict((n, self.consts.get(n, self.state[n])) for n in range(self.nrnets) \
+            if n in self.consts or not (n in driven or n in fixed))
+        known[self.clock] = 1
+        used = sorted(set(n for prods, outs in plan for p in prods for n in p) | set(n for _, outs in plan for n, _ in outs) \
+            | set(self.inputs) | set(self.outputs) | set(watch))
+        lines = ['def cycles(state, stimulus, samples, m):']
+        lines += list(f'    n{n} = state[{n}]' for n in used)
+        lines.append('    for vector in stimulus:')
+        lines.append('        ' + ', '.join('_' if n in self.consts else f'n{n}' for n in self.inputs) + \
+            (',' if len(self.inputs) == 1 else '') + ' = vector')
+        for prods, outs in plan:
+            expr = Netlist._sop(prods, known)
+            if type(expr) == str:
+                if len(outs) > 1:
+                    lines.append(f'        s = {expr}')
+                    expr = 's'
+                elif ' ' in expr:
+                    expr = f'({expr})'
+            for n, inv in outs:
+                if type(expr) == str:
+                    known.pop(n, None)
+                    lines.append(f'        n{n} = {expr} ^ m' if inv else f'        n{n} = {expr}')
+                else:
+                    known[n] = expr ^ inv
+                    lines.append(f'        n{n} = ' + ('m' if known[n] else '0'))
+        lines.append('        if not samples is None:')
+        lines.append('            samples.append((' + ''.join(f'n{n}, ' for n in list(self.outputs) + list(watch)) + '))')
+        lines += list(f'    state[{n}] = n{n}' for n in used if not n in self.consts)
+        namespace = dict()
+        exec(compile('\n'.join(lines) + '\n', f'<cycles of {self}>', 'exec'), namespace)
+        if len(watch) > 0:
+            return namespace['cycles']
+        self._cycles = namespace['cycles']
+        return self._cycles
+    def run_cycles(self, stimulus=None, n=None, samples=True):
+        """
+        Advances the netlist 'n' clock cycles, each one as clock_next(vector) for the next vector
+        of 'stimulus' (bits ordered as input_labels; default: the current inputs, held), and
+        returns the outputs after each cycle as tuples, or, with samples=False, only the outputs
+        after the last one. Levelized netlists run generated straight-line code (compiled once),
+        'events' netlists a loop of clock_next().
+        """
+        if self.clock is None:
+            self.error("there is no clock to tick.")
+        if stimulus is None:
+            if n is None:
+                self.error("run_cycles needs a stimulus or a number of cycles.")
+            stimulus = itertools.repeat(tuple(self.state[i] for i in self.inputs), n)
+        elif not n is None:
+            stimulus = itertools.islice(stimulus, n)
+        if self.mode == 'events':
+            outputs = list(tuple(self.clock_next(list(v))) for v in stimulus)
+            return outputs if samples else self.get_output_values()
+        cycles = self._cycles if not self._cycles is None else self._compile_cycles()
+        outputs = list() if samples else None
+        cycles(self.state, stimulus, outputs, 1)
+        return outputs if samples else self.get_output_values()
+    def fork(self, stimuli, snapshot=None):
+        """
+        Runs len(stimuli) independent copies of the netlist from 'snapshot' (default: the current
+        state), copy j taking one clock cycle per vector of stimuli[j] as run_cycles() does (all
+        of the same length), bitsliced: one pass per cycle for all copies, bit j of every net
+        being copy j. Returns, per copy, its outputs after each cycle; the netlist is unchanged.
+        Cycles follow the levelized engine.
+        """
+        if self.clock is None:
+            self.error("there is no clock to tick.")
+        snapshot = self.state if snapshot is None else snapshot
+        if len(snapshot) != self.nrnets:
+            self.error(f"snapshot of {len(snapshot)} nets, expecting {self.nrnets}.")
+        stimuli = list(list(s) for s in stimuli)
+        lanes = len(stimuli)
+        if lanes == 0:
+            return list()
+        nrcycles = len(stimuli[0])
+        if any(len(s) != nrcycles for s in stimuli):
+            self.error("fork needs stimuli with the same number of cycles.")
+        mask = (1 << lanes) - 1
+        words = list(tuple(int(''.join('1' if s[k][i] else '0' for s in reversed(stimuli)), 2) \
+            for i in range(len(self.inputs))) for k in range(nrcycles))
+        cycles = self._cycles if not self._cycles is None else self._compile_cycles()
+        samples = list()
+        cycles(list(mask if v else 0 for v in snapshot), words, samples, mask)
+        return list(list(tuple((w >> j) & 1 for w in sample) for sample in samples) for j in range(lanes))
+    def snapshot(self):
+        """
+        Value of every net, as bytes, to restore() later (or to fork() from).
+        """
+        return bytes(self.state)
+    def restore(self, snapshot):
+        if len(snapshot) != self.nrnets:
+            self.error(f"snapshot of {len(snapshot)} nets, expecting {self.nrnets}.")
+        self.state[:] = snapshot
+        self._active = None
+    def _generate(self, functions):
+        """
+        Source of Gate.codegen(): 'functions' holds, per type, one (products, inverted) per output
+        (products as tuples of input positions); constants and undriven nets are folded in.
+        """
+        driven, inputs = self.driven(), set(self.inputs)
+        known = dict((n, self.consts.get(n, self.state[n])) for n in range(self.nrnets) \
+            if n in self.consts or not (n in driven or n in inputs))
+        lines = [f'# {self.header()}', f'input_labels = {self.input_labels!r}', f'output_labels = {self.output_labels!r}',
+            '', '', 'def run_words(words, nrvectors):', '    m = (1 << nrvectors) - 1']
+        if len(self.inputs) > 0:
+            lines.append('    ' + ', '.join('_' if n in self.consts else f'n{n}' for n in self.inputs) + \
+                (',' if len(self.inputs) == 1 else '') + ' = (w & m for w in words)')
+        for t, ins, outs in self.gates:
+            for (products, inv), n in zip(functions[t], outs):
+                if n in self.consts:
+                    continue
+                expr = Netlist._sop(list(tuple(ins[i] for i in p) for p in products), known)
+                if type(expr) == str:
+                    known.pop(n, None)
+                    lines.append(f'    n{n} = ' + ((f'({expr})' if ' ' in expr else expr) + ' ^ m' if inv else expr))
+                else:
+                    known[n] = expr ^ inv
+        lines.append('    return [' + ', '.join(f'n{n}' if not n in known else ('m' if known[n] else '0') for n in self.outputs) + ']')
+        shifts = ', '.join(str(k) for k in reversed(range(len(self.inputs))))
+        lines += ['', '', 'def run(inputs):', '    result = 0',
+            f'    for w in run_words([inputs >> k & 1 for k in ({shifts}{"," if len(self.inputs) == 1 else ""})], 1):',
+            '        result = result << 1 | w', '    return result']
+        return '\n'.join(lines) + '\n'
+
+
+class Profile:
+    """
+    Opt-in instrumentation of the object-graph simulation. While started (or inside a 'with'
+    block), Gate.run, Circuit.run, propagate, is_short_circuit and switch_level are replaced by
+    counting and timing wrappers, and stop() puts the originals back, so nothing is paid when no
+    profile is running. Times are inclusive per component instance and per hierarchy level
+    (0 being the outermost run), and exclusive per stack of definition names, as written by
+    save_collapsed() for flame graph tools.
+    """
+    _active = None
+    _wrapped = [('Gate', 'run'), ('Circuit', 'run'), ('Gate', 'propagate'), ('Gate', 'is_short_circuit'), ('Gate', 'switch_level')]
+    def __init__(self):
+        self.runs = dict() # definition name -> run() calls
+        self.checks = dict() # definition name -> is_short_circuit() and switch_level() calls
+        self.seconds = dict() # component -> inclusive run() time
+        self.evaluations = dict() # component -> run() calls
+        self.levels = dict() # hierarchy depth -> inclusive run() time
+        self.stacks = dict() # 'Outer;Inner;Leaf' -> exclusive run() time
+        self.propagations = dict() # (component, origin wire) -> propagate() calls
+        self.visits = dict() # (component, origin wire) -> wires set by those calls
+        self._stack = list()
+        self._originals = None
+    def __enter__(self):
+        return self.start()
+    def __exit__(self, *exc):
+        self.stop()
+    def start(self):
+        if not Profile._active is None:
+            raise Exception("a profile is already running.")
+        classes = dict(Gate=Gate, Circuit=Circuit)
+        self._originals = list((classes[c], m, classes[c].__dict__[m]) for c, m in Profile._wrapped)
+        for cls, method, original in self._originals:
+            setattr(cls, method, getattr(self, f'_wrap_{method}')(original))
+        Profile._active = self
+        return self
+    def stop(self):
+        if Profile._active is self:
+            for cls, method, original in self._originals:
+                setattr(cls, method, original)
+            Profile._active = None
+    def _wrap_run(self, run):
+        stack, seconds, evaluations, levels, stacks = self._stack, self.seconds, self.evaluations, self.levels, self.stacks
+        def timed_run(component):
+            name = component.name
+            frame = [name if len(stack) == 0 else stack[-1][0] + ';' + name, 0.0]
+            stack.append(frame)
+            t = time.perf_counter()
+            try:
+                return run(component)
+            finally:
+                elapsed = time.perf_counter() - t
+                stack.pop()
+                self.runs[name] = self.runs.get(name, 0) + 1
+                seconds[component] = seconds.get(component, 0.0) + elapsed
+                evaluations[component] = evaluations.get(component, 0) + 1
+                levels[len(stack)] = levels.get(len(stack), 0.0) + elapsed
+                stacks[frame[0]] = stacks.get(frame[0], 0.0) + elapsed - frame[1]
+                if len(stack) > 0:
+                    stack[-1][1] += elapsed
+        return timed_run
+    def _wrap_propagate(self, propagate):
+        propagations, visits = self.propagations, self.visits
+        def counted_propagate(component, origin):
+            propagate(component, origin)
+            key = (component, origin)
+            propagations[key] = propagations.get(key, 0) + 1
+            visits[key] = visits.get(key, 0) + len(component.visited) - 1
+        return counted_propagate
+    def _wrap_check(self, check):
+        checks = self.checks
+        def counted_check(component):
+            checks[component.name] = checks.get(component.name, 0) + 1
+            return check(component)
+        return counted_check
+    _wrap_is_short_circuit = _wrap_switch_level = _wrap_check
+    @staticmethod
+    def _net(component, origin):
+        """
+        Readable name of a propagation origin: a label of the component or of one of its components.
+        """
+        for bus, prefix in [(component.inputs, ''), (component.outputs, '')] + \
+                list((c.outputs, f'{c}.') for c in getattr(component, 'components', []) if isinstance(c, Gate)):
+            for l, w in zip(bus.labels, bus.binvec):
+                if w is origin:
+                    return f'{component}:{prefix}{l}'
+        return f'{component}:{origin.name}'
+    def report(self, top=10):
+        """
+        Structured results: run() calls and short-circuit checks per definition, time per hierarchy
+        level and the 'top' component instances by time and by evaluations, and nets by fan-out
+        (wires set per propagation), as lists of tuples.
+        """
+        def first(d, key):
+            return sorted(d, key=key, reverse=True)[:top]
+        return dict(
+            runs=dict(sorted(self.runs.items(), key=lambda x: -x[1])),
+            checks=dict(sorted(self.checks.items(), key=lambda x: -x[1])),
+            levels=dict(sorted(self.levels.items())),
+            by_time=list((repr(c), self.seconds[c], self.evaluations[c]) for c in first(self.seconds, self.seconds.get)),
+            by_evaluations=list((repr(c), self.evaluations[c], self.seconds[c]) for c in first(self.evaluations, self.evaluations.get)),
+            by_fanout=list((Profile._net(*k), self.visits[k] / self.propagations[k], self.propagations[k]) \
+                for k in first(self.visits, lambda k: self.visits[k] / self.propagations[k])))
+    def info(self, top=10):
+        r = self.report(top)
+        print(f"Profile: {sum(r['runs'].values())} runs, {r['levels'].get(0, 0.0):.3f} s")
+        print('Runs per definition:', ', '.join(f'{k} {v}' for k, v in r['runs'].items()))
+        print('Short-circuit checks:', ', '.join(f'{k} {v}' for k, v in r['checks'].items()))
+        print('Time per level:', ', '.join(f'{k}: {v:.3f} s' for k, v in r['levels'].items()))
+        print(f'Top {top} by time:')
+        for c, s, n in r['by_time']:
+            print(f'  {c:<24} {s:10.4f} s {n:10d} runs')
+        print(f'Top {top} by evaluations:')
+        for c, n, s in r['by_evaluations']:
+            print(f'  {c:<24} {n:10d} runs {s:10.4f} s')
+        print(f'Top {top} by fan-out:')
+        for net, f, n in r['by_fanout']:
+            print(f'  {net:<40} {f:8.1f} wires {n:10d} propagations')
+    def save_collapsed(self, filename):
+        """
+        Writes the collapsed stacks ('Outer;Inner;Leaf microseconds' per line) read by flamegraph.pl
+        and compatible viewers.
+        """
+        with open(filename, 'w') as f:
+            for path, s in sorted(self.stacks.items()):
+                f.write(f'{path} {round(s * 1e6)}\n')
+
+
+class Trace:
+    """
+    Value-change dump (VCD) of selected signals of a clocked component or netlist, streamed to
+    'filename' while attached: from start() (or entering a 'with' block) to stop(). Each clock
+    cycle, clock_next() or a cycle of run_cycles(), takes two time steps: the clock high with the
+    values the cycle settled to, then the clock low. Only changes are written, 'buffer_size'
+    lines at a time, so memory does not grow with the run; clock_next() and the netlist's cycle
+    function are wrapped per instance while attached only, so a detached trace costs nothing.
+    'signals' (default: inputs, outputs and clock) are input or output labels, 'clock' and, for
+    internal nodes, a path of component indexes ending in a port label ('1.0.out' is the output
+    'out' of components[1].components[0]) or, in a netlist, a net number. fork() is not traced.
+    """
+    buffer_size = 4096 # lines kept before each write
+    _chars = '01zz' # VCD value of a wire: low, high, disconnected
+    def __init__(self, filename, target, signals=None, timescale='1 ns'):
+        if target.clock is None:
+            target.error("there is no clock to trace.")
+        self.filename = filename
+        self.target = target
+        self.timescale = timescale
+        self.netlist = isinstance(target, Netlist)
+        if signals is None:
+            labels = (target.input_labels + target.output_labels) if self.netlist else (target.inputs.labels + target.outputs.labels)
+            signals = list(dict.fromkeys(labels)) + ['clock']
+        self.names = list(str(s) for s in signals if s != 'clock')
+        self.clocked = 'clock' in signals
+        self.refs = list(self._resolve(s) for s in signals if s != 'clock')
+        self.time = 0
+        self.last = None
+        self._file = None
+        self._lines = None
+        self._samples = None
+        self._cycles = None
+    def __enter__(self):
+        return self.start()
+    def __exit__(self, *exc):
+        self.stop()
+    def _resolve(self, signal):
+        """
+        Net number (netlists) or (store, wire id) of a signal.
+        """
+        target = self.target
+        if self.netlist:
+            if type(signal) == int and 0 <= signal < target.nrnets:
+                return signal
+            if signal in target.input_labels:
+                return target.inputs[target.input_labels.index(signal)]
+            if signal in target.output_labels:
+                return target.outputs[target.output_labels.index(signal)]
+            target.error(f"no signal {signal!r} to trace.")
+        *path, label = str(signal).split('.')
+        c = target
+        for k in path:
+            if not isinstance(c, Circuit) or not k.isdigit() or int(k) >= len(c.components):
+                target.error(f"no signal {signal!r} to trace.")
+            c = c.components[int(k)]
+        if label in c.inputs:
+            w = c.inputs[label]
+        elif label in c.outputs:
+            w = c.outputs[label]
+        else:
+            target.error(f"no signal {signal!r} to trace.")
+        return (w.store, w.id)
+    @staticmethod
+    def _code(k):
+        """
+        Short VCD identifier of signal 'k', from the printable characters '!' to '~'.
+        """
+        code = chr(33 + k % 94)
+        while k >= 94:
+            k = k // 94 - 1
+            code += chr(33 + k % 94)
+        return code
+    def _sample(self):
+        if self.netlist:
+            state = self.target.state
+            return tuple(state[n] for n in self.refs)
+        return tuple(store.values[i] & 3 for store, i in self.refs)
+    def start(self):
+        if not self._file is None:
+            raise Exception(f"{self.filename} is already being traced.")
+        codes = list(Trace._code(k) for k in range(len(self.names) + 1))
+        self._codes, self._clock = codes[:-1], codes[-1]
+        self._file = open(self.filename, 'w')
+        self._lines = [f'$date {time.strftime("%Y-%m-%d %H:%M:%S")} $end', '$version ecs_simulator $end',
+            f'$timescale {self.timescale} $end', f'$scope module {self.target.name} $end']
+        self._lines += list(f'$var wire 1 {c} {n.replace(" ", "_")} $end' for c, n in zip(self._codes, self.names))
+        if self.clocked:
+            self._lines.append(f'$var wire 1 {self._clock} clock $end')
+        self._lines += ['$upscope $end', '$enddefinitions $end', f'#{self.time}', '$dumpvars']
+        self.last = self._sample()
+        self._lines += list(Trace._chars[v] + c for v, c in zip(self.last, self._codes))
+        if self.clocked:
+            self._lines.append('0' + self._clock)
+        self._lines.append('$end')
+        target, clock_next = self.target, self.target.clock_next
+        def traced_clock_next(*args):
+            outputs = clock_next(*args)
+            self._record(self._sample())
+            return outputs
+        target.clock_next = traced_clock_next
+        if self.netlist:
+            self._cycles = target._cycles if not target._cycles is None else target._compile_cycles()
+            target._cycles = self._wrap_cycles(target._compile_cycles(self.refs), self._cycles, len(target.outputs))
+        return self
+    def _wrap_cycles(self, watched, cycles, nrout):
+        def traced_cycles(state, stimulus, samples, m):
+            if m != 1:
+                return cycles(state, stimulus, samples, m)
+            self._samples, self._nrout = samples, nrout
+            try:
+                watched(state, stimulus, self, m)
+            finally:
+                self._samples = None
+        return traced_cycles
+    def append(self, sample):
+        """
+        Receives the samples of the netlist's cycle function: outputs, then the traced nets.
+        """
+        if not self._samples is None:
+            self._samples.append(sample[:self._nrout])
+        self._record(sample[self._nrout:])
+    def _record(self, values):
+        lines, last = self._lines, self.last
+        self.time += 1
+        lines.append(f'#{self.time}')
+        if self.clocked:
+            lines.append('1' + self._clock)
+        for v, u, c in zip(values, last, self._codes):
+            if v != u:
+                lines.append(Trace._chars[v] + c)
+        self.last = values
+        if self.clocked:
+            self.time += 1
+            lines += [f'#{self.time}', '0' + self._clock]
+        if len(lines) >= Trace.buffer_size:
+            self._flush()
+    def _flush(self):
+        self._file.write('\n'.join(self._lines) + '\n')
+        self._lines.clear()
+    def stop(self):
+        if self._file is None:
+            return
+        del self.target.clock_next
+        if self.netlist:
+            self.target._cycles, self._cycles = self._cycles, None
+        try:
+            self._flush()
+        finally:
+            self._file.close()
+            self._file = None
+
+
+class BDD:
+    """
+    Reduced ordered binary decision diagrams over variables 0, 1, ... (0 on top). Nodes are ints,
+    0 and 1 being the constants; each node is hash-consed in 'unique' ((variable, low, high) ->
+    node), so equal functions are the same int, and results of apply() are kept in 'computed'.
+    """
+    _ops = { 'and': lambda a, b: a & b, 'or': lambda a, b: a | b, 'xor': lambda a, b: a ^ b }
+    def __init__(self, nrvars):
+        self.nrvars = nrvars
+        self.var = [nrvars, nrvars] # constants are below every variable
+        self.low = [0, 1]
+        self.high = [0, 1]
+        self.unique = dict()
+        self.computed = dict()
+    @classmethod
+    def over(cls, labels):
+        """
+        Manager with one variable per label, in order, and the label -> variable node map.
+        """
+        bdd = cls(len(labels))
+        return bdd, dict((l, bdd.node(i, 0, 1)) for i, l in enumerate(labels))
+    @staticmethod
+    def interleaved(labels):
+        """
+        Variable order that keeps adders and multiplexers small: single inputs first, then the
+        buses (see group_by_prefix) interleaved bit by bit, aligned at their last bit:
+            ex. BDD.interleaved(['a1', 'a0', 'b1', 'b0', 'sel']) => ['sel', 'a1', 'b1', 'a0', 'b0']
+        """
+        groups = list(group_by_prefix(labels).values())
+        width = max([len(g) for g in groups] + [0])
+        order = list(g[0] for g in groups if len(g) == 1)
+        for i in range(width):
+            order += list(g[i - width + len(g)] for g in groups if len(g) > 1 and i - width + len(g) >= 0)
+        return order
+    def node(self, v, low, high):
+        if low == high:
+            return low
+        key = (v, low, high)
+        n = self.unique.get(key)
+        if n is None:
+            n = self.unique[key] = len(self.var)
+            self.var.append(v)
+            self.low.append(low)
+            self.high.append(high)
+        return n
+    def apply(self, op, f, g):
+        """
+        Node of 'f op g', op in 'and', 'or' and 'xor' (negation is 'xor' with 1).
+        """
+        if f <= 1 and g <= 1:
+            return BDD._ops[op](f, g)
+        if op == 'and':
+            if f == 0 or g == 0: return 0
+            if f == 1 or f == g: return g
+            if g == 1: return f
+        elif op == 'or':
+            if f == 1 or g == 1: return 1
+            if f == 0 or f == g: return g
+            if g == 0: return f
+        else:
+            if f == g: return 0
+            if f == 0: return g
+            if g == 0: return f
+        if f > g:
+            f, g = g, f
+        key = (op, f, g)
+        r = self.computed.get(key)
+        if r is None:
+            v = min(self.var[f], self.var[g])
+            f0, f1 = (self.low[f], self.high[f]) if self.var[f] == v else (f, f)
+            g0, g1 = (self.low[g], self.high[g]) if self.var[g] == v else (g, g)
+            r = self.computed[key] = self.node(v, self.apply(op, f0, g0), self.apply(op, f1, g1))
+        return r
+    def satisfy(self, f):
+        """
+        One assignment (variable -> 0 or 1) making 'f' true, None if f is 0; variables left out
+        can take any value.
+        """
+        if f == 0:
+            return None
+        assignment = dict()
+        while f > 1:
+            if self.low[f] != 0:
+                assignment[self.var[f]], f = 0, self.low[f]
+            else:
+                assignment[self.var[f]], f = 1, self.high[f]
+        return assignment
+    def counterexample(self, f, variables, labels):
+        """
+        Bits of 'labels' (variable nodes in 'variables') of an assignment satisfying 'f'.
+        """
+        assignment = self.satisfy(f)
+        return list(assignment.get(self.var[variables[l]], 0) for l in labels)
+    def size(self):
+        return len(self.var)
+
+
+class Word:
+    """
+    Symbolic two's complement integer: BDD bits, least significant first, the last one standing
+    for all the bits above it (sign extension). Mixes with ints in +, -, *, &, |, ^, ~, << and
+    >> (by ints) and % (by powers of two), as the reference models of Gate.check_against() do.
+    """
+    def __init__(self, bdd, bits, signed=True):
+        self.bdd = bdd
+        self.bits = list(bits) + ([] if signed and len(bits) > 0 else [0])
+    @staticmethod
+    def constant(bdd, value):
+        return Word(bdd, list((value >> k) & 1 for k in range(value.bit_length() + 1)))
+    def _word(self, other):
+        return other if isinstance(other, Word) else Word.constant(self.bdd, other)
+    def bit(self, k):
+        return self.bits[min(k, len(self.bits) - 1)]
+    def _bitwise(self, other, op):
+        other = self._word(other)
+        return Word(self.bdd, list(self.bdd.apply(op, self.bit(k), other.bit(k)) \
+            for k in range(max(len(self.bits), len(other.bits)))))
+    def __and__(self, other):
+        return self._bitwise(other, 'and')
+    def __or__(self, other):
+        return self._bitwise(other, 'or')
+    def __xor__(self, other):
+        return self._bitwise(other, 'xor')
+    __rand__, __ror__, __rxor__ = __and__, __or__, __xor__
+    def __invert__(self):
+        return Word(self.bdd, list(self.bdd.apply('xor', b, 1) for b in self.bits))
+    def __add__(self, other):
+        other, apply = self._word(other), self.bdd.apply
+        bits, carry = list(), 0
+        for k in range(max(len(self.bits), len(other.bits)) + 1):
+            a, b = self.bit(k), other.bit(k)
+            half = apply('xor', a, b)
+            bits.append(apply('xor', half, carry))
+            carry = apply('or', apply('and', a, b), apply('and', half, carry))
+        return Word(self.bdd, bits)
+    __radd__ = __add__
+    def __neg__(self):
+        return ~self + 1
+    def __sub__(self, other):
+        return self + (-self._word(other))
+    def __rsub__(self, other):
+        return self._word(other) + (-self)
+    def __lshift__(self, k):
+        return Word(self.bdd, [0]*k + self.bits)
+    def __rshift__(self, k):
+        return Word(self.bdd, self.bits[k:] or self.bits[-1:])
+    def __mod__(self, m):
+        k = m.bit_length() - 1 if type(m) == int else -1
+        if k < 0 or m != 1 << k:
+            raise TypeError("a Word is only taken modulo powers of two.")
+        return Word(self.bdd, list(self.bit(i) for i in range(k)), signed=False)
+    def __mul__(self, other):
+        other = self._word(other)
+        result = Word.constant(self.bdd, 0)
+        for k, b in enumerate(other.bits):
+            term = Word(self.bdd, list(self.bdd.apply('and', a, b) for a in self.bits)) << k
+            result = result - term if k == len(other.bits) - 1 else result + term
+        return result
+    __rmul__ = __mul__
+
+
+def equivalent(a, b, order=None):
+    """
+    Symbolic equivalence of two combinational components (or netlists) with the same input and
+    output labels: builds the BDD of every output of both, over one variable per input label in
+    'order' (default BDD.interleaved(input labels of 'a')), and returns None when they are
+    equal, otherwise a counterexample, the input bits ordered as the input labels of 'a'.
+    """
+    nets = list(c if isinstance(c, Netlist) else c.compile() for c in (a, b))
+    if set(nets[0].input_labels) != set(nets[1].input_labels) or set(nets[0].output_labels) != set(nets[1].output_labels):
+        nets[0].error(f"{nets[1]} has other inputs or outputs.")
+    bdd, variables = BDD.over(BDD.interleaved(nets[0].input_labels) if order is None else order)
+    outputs = list(dict(zip(net.output_labels, net.symbolic(bdd, list(variables[l] for l in net.input_labels)))) for net in nets)
+    for l in nets[0].output_labels:
+        diff = bdd.apply('xor', outputs[0][l], outputs[1][l])
+        if diff != 0:
+            return bdd.counterexample(diff, variables, nets[0].input_labels)
+    return None